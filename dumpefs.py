@@ -1,9 +1,51 @@
 from efs2 import *
-from stat import filemode, S_ISDIR
+from stat import filemode
 from io import RawIOBase
 
+def _extract_tree(s: EFS2, pathname: str, out_dir: str, verbose: bool=False, manifest: Manifest=None, previous: Manifest=None) -> int:
+    import os
+
+    prefix = pathname if pathname == "" or pathname.endswith("/") else pathname + "/"
+    written = []
+
+    def out_path(e: EFS2Entry) -> str:
+        return os.path.join(out_dir, e.path[len(prefix):])
+
+    def entries():
+        walk = s.walk(pathname) if previous is None else select_changed(s.walk(pathname), previous, manifest if manifest is not None else Manifest())
+
+        for e in walk:
+            if verbose:
+                print(e.path)
+
+            if e.is_dir():
+                os.makedirs(out_path(e), exist_ok=True)
+
+                if manifest is not None:
+                    manifest.add(e, None)
+
+            else:
+                yield e
+
+    def sink(e: EFS2Entry) -> RawIOBase:
+        os.makedirs(os.path.split(out_path(e))[0], exist_ok=True)
+        return open(out_path(e), "wb")
+
+    # Only files written completely go in the manifest, failed ones are left out so the next run tries them again
+    count = s.extract_many(entries(), sink, done=written.append)
+
+    # Pages are written out of order (or by the kernel), so hash what landed on disk
+    if manifest is not None:
+        for e in written:
+            manifest.add(e, hash_entry(e) if e.is_symlink() else hash_file(out_path(e)))
+
+    return count
+
 def _do_efs_shell(s: EFS2, name: str):
     import shlex
+    import shutil
+    import json
+    import re
     import os
     import sys
     import hexdump
@@ -19,10 +61,18 @@ def _do_efs_shell(s: EFS2, name: str):
                 if cmd[0] == "exit":
                     break
 
+                elif cmd[0] in ["ls", "dir"] and "--json" in cmd:
+                    # One object per entry, straight from the directory listing
+                    for k in ([a for a in cmd[1:] if a != "--json"] or [""]):
+                        for e in s.scandir(k):
+                            sys.stdout.write(json.dumps(e.to_dict(), ensure_ascii=False) + "\n")
+
                 elif cmd[0] in ["ls", "dir"]:
+                    columns = shutil.get_terminal_size().columns
+
                     def print_info(l, info):
                         info_str = f"{filemode(info.mode)}  {info.modified_time.strftime('%Y-%m-%d %H:%M:%S')}  {info.created_time.strftime('%Y-%m-%d %H:%M:%S')}"
-                        pad_num = (os.get_terminal_size().columns // 2) - len(l)
+                        pad_num = (columns // 2) - len(l)
                         print(f"{l}{' '*pad_num}{info_str}")
 
                     if len(cmd) == 1:
@@ -51,23 +101,46 @@ def _do_efs_shell(s: EFS2, name: str):
                         print(f"{cmd[0]}: usage: {cmd[0]} filename destination")
 
                     elif cmd[1].endswith("*"):
-                        def sf_recurse(p, h="", k=""):
-                            for f in s.ls(h + p):
-                                if f.endswith("/"):
-                                    sf_recurse(f, h + p, p + k)
-
-                                elif f not in [".", ".."]:
-                                    t = s.open(h + p + f)
-                                    os.makedirs(os.path.split(os.path.join(cmd[2], k, f))[0], exist_ok=True)
-                                    open(os.path.join(cmd[2], k, f), "wb").write(t.read())
-
-                        sf_recurse(cmd[1].rstrip("*"))
+                        _extract_tree(s, cmd[1].rstrip("*"), cmd[2])
 
                     else:
                         t = s.open(cmd[1])
                         os.makedirs(os.path.split(cmd[2])[0], exist_ok=True)
                         open(cmd[2], "wb").write(t.read())
 
+                elif cmd[0] == "find":
+                    for k in ([a for a in cmd[1:] if a != "--json"] or [""]):
+                        for e in s.walk(k):
+                            print(json.dumps(e.to_dict(), ensure_ascii=False) if "--json" in cmd else e.path)
+
+                elif cmd[0] in ["hash", "manifest"]:
+                    algorithms = ["sha256"]
+                    if len(cmd) > 2 and cmd[1] == "-a":
+                        algorithms = cmd[2].split(",")
+                        cmd = cmd[:1] + cmd[3:]
+
+                    for k in (cmd[1:] if len(cmd) > 1 else [""]):
+                        for record in s.hash_files(k, algorithms):
+                            print(json.dumps(record, ensure_ascii=False))
+
+                elif cmd[0] in ["grep", "search"]:
+                    flags = [a for a in cmd[1:] if a in ["-e", "-x", "-i"]]
+                    args = [a for a in cmd[1:] if a not in flags]
+
+                    if len(args) == 0:
+                        print(f"{cmd[0]}: usage: {cmd[0]} [-e] [-x] [-i] pattern [dirs...]")
+
+                    else:
+                        # -x: hexadecimal bytes, -e: regular expression, -i: ignore case, otherwise plain text
+                        pattern = bytes.fromhex(args[0]) if "-x" in flags else args[0].encode(s.encoding)
+                        if "-e" in flags or "-i" in flags:
+                            pattern = re.compile(pattern if "-e" in flags else re.escape(pattern), re.IGNORECASE if "-i" in flags else 0)
+
+                        for k in (args[1:] if len(args) > 1 else [""]):
+                            for m in s.grep(pattern, k):
+                                text = "".join(chr(c) if 0x20 <= c < 0x7f else "." for c in m["before"] + m["match"] + m["after"])
+                                print(f"{m['path']}: 0x{m['offset']:08x}: {text}")
+
                 elif cmd[0] == "pwd":
                     print(s.pwd)
 
@@ -99,7 +172,11 @@ def _do_efs_shell(s: EFS2, name: str):
                             t = s.open(f)
                             hexdump.hexdump(t.read())
 
-                elif cmd[0] == "file":
+                elif cmd[0] in ["file", "stat"] and "--json" in cmd:
+                    for f in [a for a in cmd[1:] if a != "--json"]:
+                        print(json.dumps(EFS2Entry(s, f, s.stat(f)).to_dict(), ensure_ascii=False))
+
+                elif cmd[0] in ["file", "stat"]:
                     if len(cmd) == 1:
                         print(f"{cmd[0]}: usage: {cmd[0]} files...")
 
@@ -113,17 +190,34 @@ def _do_efs_shell(s: EFS2, name: str):
                             print(f"    number of blocks: {t.blocks}")
                             print(f"    generation: {t.generation}")
 
+                elif cmd[0] == "extents":
+                    if len(cmd) == 1:
+                        print(f"{cmd[0]}: usage: {cmd[0]} files...")
+
+                    else:
+                        for f in cmd[1:]:
+                            print(f"{f}: ")
+                            for offset, length in s.extents(f):
+                                print(f"    0x{offset:08x} - 0x{offset + length:08x} ({length} bytes)")
+
                 elif cmd[0] == "help":
-                    print("ls [files...] (list all files and folders in this directory)")
-                    print("dir [files...] (ditto)")
+                    print("ls [--json] [files...] (list all files and folders in this directory, --json for one JSON object per line)")
+                    print("dir [--json] [files...] (ditto)")
                     print("cd [dir] (change the working directory)")
                     print("dump [files...] (read files and save)")
+                    print("find [--json] [dirs...] (list everything below the directories)")
+                    print("hash [-a algorithms] [dirs...] (NDJSON digests of every file below the directories, default sha256)")
+                    print("manifest [-a algorithms] [dirs...] (ditto)")
+                    print("grep [-e] [-x] [-i] pattern [dirs...] (search the contents of every file, -e regular expression, -x hexadecimal bytes, -i ignore case)")
+                    print("search [-e] [-x] [-i] pattern [dirs...] (ditto)")
                     print("pwd (get the current working directory)")
                     print("encoding [encoding] (set the encoding used to read node filenames)")
                     print("cat files... (read files and output to console)")
                     print("hexdump files... (read files and output in hexdump)")
                     print("hd files... (short for hexdump)")
-                    print("file files... (get file info)")
+                    print("file [--json] files... (get file info)")
+                    print("stat [--json] files... (ditto)")
+                    print("extents files... (where the file data is in the image)")
                     print("help (show this help message)")
 
                 else:
@@ -133,8 +227,10 @@ def _do_efs_shell(s: EFS2, name: str):
             print(f"{cmd[0]}: {type(e).__name__}: {e}")
 
 if __name__ == "__main__":
-    import zipfile
     import argparse
+    import json
+    import os
+    import sys
 
     def intorhex(d):
         try:
@@ -145,14 +241,19 @@ if __name__ == "__main__":
 
     ap = argparse.ArgumentParser("dumpefs")
     ap.add_argument("in_filename", help="Source file")
-    ap.add_argument("out_filename", help="Destination file (to zip, leave blank to enter shell)", nargs="?")
+    ap.add_argument("out_filename", help="Destination file (zip, or tar when it ends with .tar, .tar.gz, .tgz, .tar.bz2 or .tar.xz, or a directory when it ends with a slash, leave blank to enter shell)", nargs="?")
 
     ap.add_argument("-e", "--ecc", action="store_true", help="Enable ECC engine")
     ap.add_argument("-es", "--ecc-spare-offset", default=0, type=intorhex, help="Offset to spare (RIFF) or Page size (standard) when using ECC, use 0x prefix to parse as hexadecimal")
     ap.add_argument("-et", "--ecc-spare-type", choices=["riff", "standard", "qcom", "separate"], default="riff", help="Specify which NAND format to parse: (riff = RIFF Box/Spare at end, standard = Data/Spare interleaved, qcom = QCOM NANDC 2k format, separate = separate Data/NAND)")
+    ap.add_argument("-esf", "--ecc-spare-file", help="Spare (OOB) file when using the separate spare type")
     ap.add_argument("-eb", "--ecc-bbm", type=intorhex, default=5, help="Bad blocks offset (ineffective on QCOM nandc mode)")
     ap.add_argument("-ew", "--ecc-width", choices=[8, 16], default=16, type=int, help="Page width")
     ap.add_argument("-ea", "--ecc-algo", choices=["rs", "hamming20", "hamming20_bitpack"], default="rs", help="Error correction algorithm (rs = Reed-Solomon, hamming20 = Qualcomm 20-bit hamming code)")
+    ap.add_argument("-eP", "--ecc-probe", action="store_true", help="Sample the dump, rank the possible NAND layouts and ECC settings, then exit")
+    ap.add_argument("-er", "--ecc-read-ahead", type=int, default=0, help="Number of sectors to decode ahead of the reader in a background thread (default: disabled)")
+    ap.add_argument("-ec", "--ecc-cache", nargs="?", const="", help="Keep corrected sectors in a sidecar file and reuse them on later runs (default: <in_filename>.ecccache)")
+    ap.add_argument("-eR", "--ecc-report", help="Write a per-sector ECC health report (JSON, or CSV when the name ends with .csv)")
 
     mg = ap.add_mutually_exclusive_group()
     mg.add_argument("-s", "--start-offset", type=intorhex, default=-1, help="Pointer to EFS2 filesystem (default: autodetect, use 0x prefix to parse as hexadecimal)")
@@ -163,38 +264,77 @@ if __name__ == "__main__":
     ap.add_argument("-c", "--encoding", default="latin-1", help="Text encoding to use")
     ap.add_argument("-nl", "--no-log", default=False, help="Do not parse log journal (you shouldn't use this flag unless the file doesn't want to open)", action="store_true")
     ap.add_argument("-ne", "--no-errors", default=False, help="Ignore errors during dir", action="store_true")
-    ap.add_argument("-bs", "--block-size", default=0x20000, help="Block size (only applicable when using partition to determine offset)")
+    ap.add_argument("-bs", "--block-size", type=intorhex, help="Block size (default: inferred from the partition table when using partition to determine offset, 0x20000 otherwise)")
+    ap.add_argument("-cl", "--compress-level", type=int, choices=range(0, 10), default=9, metavar="{0-9}", help="Compression level of the zip or tar output (default: 9)")
+    ap.add_argument("-st", "--store", action="store_true", help="Store files in the zip or tar output without compressing them")
+    ap.add_argument("-j", "--jobs", type=int, default=0, help="Number of threads compressing the zip output or hashing with --hash-manifest (default: one per CPU)")
+    ap.add_argument("-mf", "--manifest", nargs="?", const="", help="Write a manifest of the exported files (default: <out_filename>.manifest.ndjson)")
+    ap.add_argument("-im", "--incremental", help="Previous manifest, only export what changed since (also writes a new manifest)")
+    ap.add_argument("-O", "--object-store", action="store_true", help="Treat out_filename as a content-addressed object store shared between images, and add this image to it")
+    ap.add_argument("-On", "--object-name", help="Name of this image in the object store (default: in_filename without its directory)")
+    ap.add_argument("-hm", "--hash-manifest", action="store_true", help="Write the digests of every file as NDJSON to out_filename (- for stdout) instead of exporting")
+    ap.add_argument("-ha", "--hash-algorithms", default="sha256", help="Comma separated hashlib algorithms for --hash-manifest (default: sha256)")
+    ap.add_argument("-ls", "--list", action="store_true", help="Write the metadata of every entry as NDJSON to out_filename (- for stdout) instead of exporting")
+    ap.add_argument("-S", "--sparse", action="store_true", help="Source was written with --sparse by fixdump or partsplitter, read holes back as erased (0xff) data")
+    ap.add_argument("-bb", "--skip-bad-blocks", action="store_true", help="Scan the bad block markers and read the dump with bad blocks skipped (needs -e)")
+    ap.add_argument("-bt", "--bbt", help="Bad block table file, loaded if it exists, otherwise scanned (needs -e) and saved")
 
     args = ap.parse_args()
-    if args.ecc_spare_type == "seperate":
-        ap.error("Sorry, but inputing seperate files (data and obb) is not currently supported at this time.")
+
+    # NDJSON on stdout has to stay machine-readable, so whatever else gets printed
+    # while opening and reading the image (autodetection, log, ECC warnings) goes to stderr
+    ndjson_out = sys.stdout
+    if (args.list or args.hash_manifest) and args.out_filename == "-":
+        sys.stdout = sys.stderr
+    if args.ecc_cache == "":
+        args.ecc_cache = args.in_filename + ".ecccache"
+
+    if args.ecc_spare_type == "separate" and args.ecc_spare_file is None:
+        ap.error("The separate spare type needs the OOB file, pass it with --ecc-spare-file")
+
+    if args.ecc_probe:
+        spare_type_names = {SpareType.RIFF: "riff", SpareType.STANDARD: "standard", SpareType.QCOM_2K: "qcom", SpareType.SEPARATE: "separate"}
+        algo_names = {EccRs: "rs", EccHamming20: "hamming20", EccHamming20Bitpack: "hamming20_bitpack", EccHamming20Bitpack16: "hamming20_bitpack"}
+
+        results = probe_layout(args.in_filename, spare_file=args.ecc_spare_file)
+        if len(results) <= 0:
+            ap.error("No layout matched, the dump may not include spare data")
+
+        for r in results[:10]:
+            print(f"{r.score * 100:6.2f}%  -e -et {spare_type_names[r.spare_type]} -es 0x{r.spare_offset_page_size:x} -eb {r.bbm} -ew {r.page_width} -ea {algo_names[r.ecc_algo]}  ({r.clean}/{r.samples})")
+
+        ap.exit()
 
     s = None
+    ecc_files = []
+    block_size = args.block_size if args.block_size is not None else 0x20000
+    bbt = None
 
-    def lookup_partition(in_file: RawIOBase, part_name: str, block_size: int):
-        partTable = None
+    if args.bbt is not None and os.path.exists(args.bbt):
+        bbt = BadBlockTable.load(args.bbt)
 
-        while True:
-            a = in_file.read(block_size)
+    elif (args.skip_bad_blocks or args.bbt is not None) and not args.ecc:
+        ap.error("Scanning for bad blocks needs the spare data, use -e or pass an existing --bbt file")
 
-            try:
-                if a[0x200:0x208] == b"\xAA\x73\xEE\x55\xDB\xBD\x5E\xE3":
-                    partTable = PartitionTable(a[0x200:], block_size)
-                    break
+    if args.sparse and args.ecc:
+        ap.error("Sparse images are already corrected, they can't be opened with -e")
 
-                elif a[0x800:0x808] == b"\xAA\x73\xEE\x55\xDB\xBD\x5E\xE3":
-                    partTable = PartitionTable(a[0x800:], block_size)
-                    break
+    if args.object_store and (args.incremental is not None or args.manifest is not None):
+        ap.error("--object-store keeps its own manifest per image, it can't be combined with --manifest or --incremental")
 
-                elif a[0x1000:0x1008] == b"\xAA\x73\xEE\x55\xDB\xBD\x5E\xE3":
-                    partTable = PartitionTable(a[0x1000:], block_size)
-                    break
+    def open_image():
+        return SparseFile(args.in_filename) if args.sparse else open(args.in_filename, "rb")
 
-            except Exception:
-                pass
+    def lookup_partition(in_file: RawIOBase, part_name: str, block_size: int):
+        try:
+            partTable = find_partition_table(in_file, block_size)
 
-        if partTable is None:
-            raise Exception("Could not find partition table")
+        except Exception as e:
+            ap.error(e)
+
+        finally:
+            # The filesystem opens the image again, don't leave this one (and its read-ahead) behind
+            in_file.close()
 
         for p in partTable.partitions:
             if p.name == part_name:
@@ -204,59 +344,112 @@ if __name__ == "__main__":
 
     if args.cefs:
         if args.partition is not None:
-            start = lookup_partition(open(args.in_filename, "rb"), args.partition, args.block_size)[0]
+            start = lookup_partition(open_image(), args.partition, args.block_size)[0]
 
         else:
             start = 0 if args.start_offset == -1 else args.start_offset
 
-        s = CEFS(open(args.in_filename, "rb"), start, args.encoding, errors=not args.no_errors)
+        s = CEFS(open_image(), start, args.encoding, errors=not args.no_errors)
 
     else:
         if args.ecc:
-            ecc_spare_type_map = {"riff": SpareType.RIFF, "standard": SpareType.STANDARD, "qcom": SpareType.QCOM_2K}
+            ecc_spare_type_map = {"riff": SpareType.RIFF, "standard": SpareType.STANDARD, "qcom": SpareType.QCOM_2K, "separate": SpareType.SEPARATE}
             ecc_algo_map = {"rs": EccRs, "hamming20": EccHamming20, "hamming20_bitpack": EccHamming20Bitpack if args.ecc_width == 8 else EccHamming20Bitpack16}
 
+            def ecc_wrapper(x):
+                temp = ECCFile(x, args.ecc_spare_offset, ecc_spare_type_map[args.ecc_spare_type], args.ecc_bbm, args.ecc_width, ecc_algo_map[args.ecc_algo], args.ecc_read_ahead, args.ecc_report is not None, args.ecc_cache, args.ecc_spare_file)
+                ecc_files.append(temp)
+                return temp
+
+            if bbt is None and (args.skip_bad_blocks or args.bbt is not None):
+                with ecc_wrapper(args.in_filename) as scan_file:
+                    bbt = BadBlockTable.scan(scan_file, block_size, args.ecc_spare_offset if args.ecc_spare_type == "standard" else block_size // (32 if block_size <= 0x4000 else 64))
+                if args.bbt is not None:
+                    bbt.save(args.bbt)
+
+            if bbt is not None:
+                print(f"Bad blocks skipped: {', '.join(f'0x{b:x}' for b in bbt.bad_blocks) or 'none'}")
+
             if args.partition is not None:
-                start, end = lookup_partition(ECCFile(args.in_filename, args.ecc_spare_offset, ecc_spare_type_map[args.ecc_spare_type], args.ecc_bbm, args.ecc_width, ecc_algo_map[args.ecc_algo]), args.partition, args.block_size)
+                start, end = lookup_partition(ecc_wrapper(args.in_filename) if bbt is None else BlockSkipFile(ecc_wrapper(args.in_filename), bbt), args.partition, args.block_size)
 
             else:
                 start = args.start_offset
                 end = -1
 
             try:
-                s = EFS2(open(args.in_filename, "rb"), start, args.superblock, io_wrapper=lambda x: ECCFile(x, args.ecc_spare_offset, ecc_spare_type_map[args.ecc_spare_type], args.ecc_bbm, args.ecc_width, ecc_algo_map[args.ecc_algo]), log=not args.no_log, encoding=args.encoding, end_offset=end, errors=not args.no_errors)
+                if bbt is not None:
+                    # Superblocks have to be searched in the linear (corrected, bad blocks skipped) space
+                    s = EFS2(BlockSkipFile(ecc_wrapper(args.in_filename), bbt), start, args.superblock, io_wrapper=None, log=not args.no_log, encoding=args.encoding, end_offset=end, errors=not args.no_errors)
+
+                else:
+                    s = EFS2(open(args.in_filename, "rb"), start, args.superblock, io_wrapper=ecc_wrapper, log=not args.no_log, encoding=args.encoding, end_offset=end, errors=not args.no_errors)
 
             except ValueError as e:
                 ap.error(e)
 
         else:
+            def raw_open():
+                return open_image() if bbt is None else BlockSkipFile(open_image(), bbt)
+
             if args.partition is not None:
-                start, end = lookup_partition(open(args.in_filename, "rb"), args.partition, args.block_size)
+                start, end = lookup_partition(raw_open(), args.partition, args.block_size)
 
             else:
                 start = args.start_offset
                 end = -1
 
-            s = EFS2(open(args.in_filename, "rb"), start, args.superblock, io_wrapper=None, log=not args.no_log, encoding=args.encoding, end_offset=end, errors=not args.no_errors)
+            s = EFS2(raw_open(), start, args.superblock, io_wrapper=None, log=not args.no_log, encoding=args.encoding, end_offset=end, errors=not args.no_errors)
 
     if args.out_filename is None:
         _do_efs_shell(s, args.in_filename)
 
     else:
-        with zipfile.ZipFile(args.out_filename, "w", zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
-            for f, inode in s.ls_recursive("/"):
-                print(f)
-                try:
-                    date = inode.modified_time.timetuple()[:6]
-                    info = zipfile.ZipInfo(filename=f.lstrip("/"), date_time=date if date[0] >= 1980 else (1980, 1, 1, 0, 0, 0))
-                    info.compress_type = zipfile.ZIP_DEFLATED
-                    if S_ISDIR(inode.mode):
-                        zf.open(info, "w").write(b"")
+        tar_compressions = {".tar": "", ".tar.gz": "gz", ".tgz": "gz", ".tar.bz2": "bz2", ".tar.xz": "xz"}
+        tar_compression = next((c for ext, c in tar_compressions.items() if args.out_filename.lower().endswith(ext)), None)
 
-                    else:
-                        zf.open(info, "w").write(s.open(f).read())
+        previous = None if args.incremental is None else Manifest.load(args.incremental)
+        manifest = None if args.manifest is None and previous is None else Manifest()
+
+        if args.list:
+            # Streamed from the walk, nothing is kept in memory
+            out = ndjson_out if args.out_filename == "-" else open(args.out_filename, "w", encoding="utf-8", newline="\n")
+            for e in s.walk("/"):
+                out.write(json.dumps(e.to_dict(), ensure_ascii=False) + "\n")
+
+            if out is not ndjson_out:
+                out.close()
+
+        elif args.hash_manifest:
+            out = ndjson_out if args.out_filename == "-" else open(args.out_filename, "w", encoding="utf-8", newline="\n")
+            for record in s.hash_files("/", args.hash_algorithms.split(","), args.jobs):
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+            if out is not ndjson_out:
+                out.close()
+
+        elif args.object_store:
+            # The store keeps its own manifest per image, and only reads what changed since the last time
+            export_store(s, args.out_filename, args.object_name or os.path.basename(args.in_filename), "/", 0 if args.store else args.compress_level)
+
+        elif args.out_filename.endswith(("/", os.sep)) or os.path.isdir(args.out_filename):
+            _extract_tree(s, "/", args.out_filename, True, manifest, previous)
+
+        elif tar_compression is not None:
+            export_tar(s, args.out_filename, "/", "" if args.store else tar_compression, args.compress_level, manifest=manifest, previous=previous)
+
+        else:
+            export_zip(s, args.out_filename, "/", args.compress_level, args.store, args.jobs, manifest=manifest, previous=previous)
+
+        if manifest is not None:
+            manifest.save(args.manifest or args.out_filename.rstrip("/" + os.sep) + ".manifest.ndjson")
+
+        if previous is not None:
+            print(f"incremental: {len(manifest)} entries, {len(previous.removed(manifest))} removed since the previous manifest")
+
+    if args.ecc_report is not None and len(ecc_files) > 0:
+        stats = ECCStats(ecc_files[0].stats.sector_count)
+        for f in ecc_files:
+            stats.update(f.stats)
 
-                except Exception as e:
-                    import traceback
-                    traceback.print_exc()
-                    print(f"error: {e}")
+        stats.save(args.ecc_report, block_size // 0x200)
@@ -1,7 +1,15 @@
-from .efs2 import EFS2, compute_efs2_size
+from .efs2 import EFS2, EFS2Entry, compute_efs2_size
 from .cefs import CEFS
 from .ecc import ECCFile, EccRs, EccHamming20, EccHamming20Bitpack, EccHamming20Bitpack16, SpareType, ECCError
-from .partition import PartitionTable
+from .ecc_stats import ECCStats, SectorStatus
+from .ecc_cache import ECCCache
+from .ecc_probe import ProbeResult, probe_layout
+from .partition import PartitionTable, find_partition_table
+from .bbt import BadBlockTable, BlockSkipFile
+from .export import export_zip, export_tar, export_store
+from .store import ObjectStore
+from .manifest import Manifest, hash_entry, hash_file, select_changed
+from .sparse import SparseWriter, SparseFile, write_sparse, fill_holes
 
-__all__ = ["EFS2", "CEFS", "ECCFile", "EccRs", "EccHamming20", "EccHamming20Bitpack", "EccHamming20Bitpack16", "SpareType", "ECCError", "PartitionTable", "compute_efs2_size"]
+__all__ = ["EFS2", "EFS2Entry", "CEFS", "ECCFile", "EccRs", "EccHamming20", "EccHamming20Bitpack", "EccHamming20Bitpack16", "SpareType", "ECCError", "ECCStats", "SectorStatus", "ECCCache", "ProbeResult", "probe_layout", "PartitionTable", "find_partition_table", "BadBlockTable", "BlockSkipFile", "SparseWriter", "SparseFile", "write_sparse", "fill_holes", "export_zip", "export_tar", "export_store", "ObjectStore", "Manifest", "hash_entry", "hash_file", "select_changed", "compute_efs2_size"]
     
@@ -0,0 +1,135 @@
+from construct import Struct, Const, Int32ul
+from io import RawIOBase, SEEK_SET, SEEK_CUR, SEEK_END
+from array import array
+from .ecc import ECCFile
+
+__all__ = [
+    'BadBlockTable',
+    'BlockSkipFile'
+]
+
+BBT_HEADER = Struct(
+    "magic" / Const(b"EFSBBT01"),
+    "block_size" / Int32ul,
+    "physical_blocks" / Int32ul,
+    "logical_blocks" / Int32ul,
+)
+
+# Logical to physical erase block map of a NAND dump, with factory/runtime bad blocks skipped
+class BadBlockTable():
+    def __init__(self, block_size: int, physical_blocks: int, blocks: array) -> None:
+        self.block_size: int = block_size
+        self.physical_blocks: int = physical_blocks
+        self.blocks: array = blocks # index: logical block, value: physical block
+
+    @classmethod
+    def scan(cls, nand: ECCFile, block_size: int=0x20000, page_size: int=0x800, pages: list[int]=[0, 1]) -> "BadBlockTable":
+        # A block is bad when the marker of its first or second page isn't 0xff
+        physical_blocks = nand.size // block_size
+        blocks = array('I')
+
+        for block in range(physical_blocks):
+            bad = False
+
+            for page in pages:
+                marker = nand.read_bbm(((block * block_size) + (page * page_size)) // 0x200)
+                if marker != b"\xff" * len(marker):
+                    bad = True
+                    break
+
+            if not bad:
+                blocks.append(block)
+
+        return cls(block_size, physical_blocks, blocks)
+
+    @classmethod
+    def load(cls, filename: str) -> "BadBlockTable":
+        with open(filename, "rb") as f:
+            header = BBT_HEADER.parse(f.read(BBT_HEADER.sizeof()))
+
+            blocks = array('I')
+            blocks.frombytes(f.read(header.logical_blocks * blocks.itemsize))
+
+        return cls(header.block_size, header.physical_blocks, blocks)
+
+    def save(self, filename: str) -> None:
+        with open(filename, "wb") as f:
+            f.write(BBT_HEADER.build({"block_size": self.block_size, "physical_blocks": self.physical_blocks, "logical_blocks": len(self.blocks)}))
+            f.write(self.blocks.tobytes())
+
+    @property
+    def bad_blocks(self) -> list[int]:
+        good = set(self.blocks)
+        return [b for b in range(self.physical_blocks) if b not in good]
+
+    @property
+    def size(self) -> int:
+        return len(self.blocks) * self.block_size
+
+    def to_physical(self, offset: int) -> int:
+        return (self.blocks[offset // self.block_size] * self.block_size) + (offset % self.block_size)
+
+    def __repr__(self) -> str:
+        return "<{klass} block_size=0x{block_size:x} physical_blocks={physical} bad_blocks={bad}>".format(
+            klass=self.__class__.__name__,
+            block_size=self.block_size,
+            physical=self.physical_blocks,
+            bad=self.bad_blocks,
+        )
+
+# Linear view of a dump with the bad blocks taken out
+class BlockSkipFile(RawIOBase):
+    def __init__(self, inp: RawIOBase, bbt: BadBlockTable) -> None:
+        self.__fio: RawIOBase = inp
+        self.__bbt: BadBlockTable = bbt
+        self.__cur_offset: int = 0
+        self.__closed: bool = False
+
+    def seek(self, to: int, where: int=SEEK_SET) -> int:
+        if where == SEEK_SET:
+            self.__cur_offset = to
+
+        elif where == SEEK_CUR:
+            self.__cur_offset += to
+
+        elif where == SEEK_END:
+            self.__cur_offset = self.__bbt.size + to
+
+        return self.__cur_offset
+
+    def tell(self) -> int:
+        return self.__cur_offset
+
+    def read(self, count: int=-1) -> bytes:
+        if self.__closed:
+            return b""
+
+        temp = bytearray()
+        size = self.__bbt.size
+
+        while count != 0 and self.__cur_offset < size:
+            # Never read past the end of the current block, the next logical block may be elsewhere
+            read_size = self.__bbt.block_size - (self.__cur_offset % self.__bbt.block_size)
+            if count > 0:
+                read_size = min(read_size, count)
+
+            self.__fio.seek(self.__bbt.to_physical(self.__cur_offset))
+            data = self.__fio.read(read_size)
+            if len(data) <= 0:
+                break
+
+            temp += data
+            self.__cur_offset += len(data)
+
+            if count > 0:
+                count -= len(data)
+
+        return bytes(temp)
+
+    def close(self) -> None:
+        if not self.__closed:
+            self.__fio.close()
+            self.__closed = True
+
+    def __del__(self) -> None:
+        self.close()
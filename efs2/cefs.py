@@ -6,6 +6,9 @@ from .info import EFSInfo
 from .db import Database
 from io import RawIOBase
 from .utils import ilog2
+from array import array
+from threading import RLock
+import re
 
 CEFS_FACTORY_V2 = Struct(
     Const(b'\x87\x67\x85\x34'),
@@ -63,48 +66,62 @@ class CEFSFactory(Superblock):
         # 05 - Upper Data
         self.upper_data: list[int] = factory.upper_data
 
+# Reverses the bit order of a byte, to turn LSB-first maps into MSB-first ones
+_BIT_REVERSE = bytes(int(f"{i:08b}"[::-1], 2) for i in range(256))
+
+# Free map bits -> one byte per cluster, 1 = used
+_USED_LSB_FREE = bytes.maketrans(b"01", b"\x01\x00") # v3+: 1: Free, 0: Used
+_USED_MSB_USED = bytes.maketrans(b"01", b"\x00\x01") # older: 0: Free, 1: Used
+
 class CEFSPM(PageManager):
     def __init__(self, sb: CEFSFactory, file: RawIOBase, base_offset: int) -> None:
         super().__init__(sb, file, base_offset)
         file.seek(sb.page_size + base_offset)
 
-        self.__map = file.read(0x100000)
-        self.__ptables = [0xffffffff] * sb.cefs_page_count
-        self.__rtables = [0xffffffff] * sb.cefs_page_count
+        # One bit per cluster, nothing past that is part of the map
+        self.__map = file.read((sb.cefs_page_count + 7) >> 3)
+        self.__ptables: array = array('I')
+        self.__rtables: array = array('I') # index: page - first page
+        self.__first_page: int = 0
 
-    def __check_fcache_free(self, cluster: int) -> int:
-        fc_offset = cluster >> 3
-        fc_bit = cluster & 7
+    def __used_clusters(self) -> bytes:
+        count = self.super.cefs_page_count
+        data = self.__map
 
         if self.super.factory_version >= 3:
-            return self.__map[fc_offset] & (1 << fc_bit) # 1: Free, 0: Used
+            # A short map means the remaining clusters are free
+            data = (data + b"\xff" * (((count + 7) >> 3) - len(data))).translate(_BIT_REVERSE)
+            return format(int.from_bytes(data, "big"), f"0{len(data) * 8}b")[:count].encode().translate(_USED_LSB_FREE)
 
-        else:
-            return (self.__map[fc_offset] & (1 << (7 - fc_bit))) == 0 # 0: Free, 1: Used
+        data = data + b"\x00" * (((count + 7) >> 3) - len(data))
+        return format(int.from_bytes(data, "big"), f"0{len(data) * 8}b")[:count].encode().translate(_USED_MSB_USED)
 
     def compute_ptables(self) -> None:
         self.super: CEFSFactory
 
-        cluster = 0
         page = self._base_offset // self.super.page_size
-
         fs_page_start = (((self.super.page_size << 3) + self.super.cefs_page_count + -1) // (self.super.page_size << 3)) + 1
 
-        while cluster < self.super.cefs_page_count:
-            while cluster < self.super.cefs_page_count and self.__check_fcache_free(cluster):
-                cluster += 1
+        page = page if self.super.factory_version >= 3 else page + fs_page_start
+
+        self.__first_page = page
+        self.__rtables = array('I')
+        self.__ptables = array('I', b"\xff" * (self.super.cefs_page_count * 4))
+
+        # Used clusters are stored back to back in cluster order, so every run of them maps to a run of pages
+        for run in re.finditer(b"\x01+", self.__used_clusters()):
+            start, end = run.span()
 
-            if cluster < self.super.cefs_page_count:
-                self.__ptables[cluster] = page if self.super.factory_version >= 3 else page + fs_page_start
-                self.__rtables[self.__ptables[cluster]] = cluster
-                cluster += 1
-                page += 1
+            self.__ptables[start:end] = array('I', range(page, page + (end - start)))
+            self.__rtables.extend(range(start, end))
+            page += end - start
 
     def get_forward(self, cluster: int) -> int:
         return self.__ptables[cluster]
 
     def get_reverse(self, page: int) -> int:
-        return self.__rtables[page]
+        page -= self.__first_page
+        return self.__rtables[page] if 0 <= page < len(self.__rtables) else 0xffffffff
 
 class CEFS(EFS2):
     def __init__(self, file: RawIOBase, base_offset: int=0, encoding: str="latin-1", errors: bool=True) -> None:
@@ -112,6 +129,7 @@ class CEFS(EFS2):
         self._file: RawIOBase = file
         self._closed: bool = True
         self._errors: bool = errors
+        self._io_lock: RLock = RLock()
 
         self.base_offset = base_offset
 
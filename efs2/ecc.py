@@ -1,8 +1,16 @@
 from abc import ABCMeta
 from abc import abstractmethod
 from enum import IntEnum
-from io import RawIOBase, SEEK_SET, SEEK_CUR, SEEK_END, BytesIO
+from io import RawIOBase, SEEK_SET, SEEK_CUR, SEEK_END, UnsupportedOperation
+from weakref import WeakValueDictionary, WeakMethod, finalize
+from threading import Thread, Event, current_thread
+from queue import Queue, Full
+from time import perf_counter
+from .ecc_stats import ECCStats, SectorStatus
+from .ecc_cache import ECCCache
+from hashlib import sha256
 import reedsolo as rs
+import mmap
 import os
 
 __all__ = [
@@ -33,9 +41,39 @@ ECC_XOR_TABLE = [
     0,85,86,3,89,12,15,90,90,15,12,89,3,86,85,0
 ]
 
+# Erased flash reads back as all 0xFF, erased-region checks compare against slices of this
+ERASED_DATA = b"\xff" * 0x10800
+
 class ECCError(Exception):
     pass
 
+# Drop the bad block marker (one byte on x8, two bytes on x16) from a spare area
+def _strip_bbm(spare: bytes, bbm: int, page_width: int) -> bytes:
+    bbm_mul = (bbm * (2 if page_width == 16 else 1))
+    return spare[:bbm_mul] + spare[bbm_mul + (2 if page_width == 16 else 1):]
+
+# Read-only mappings of source images, shared between every ECCFile opened over the same file
+_MAPPINGS: WeakValueDictionary = WeakValueDictionary()
+
+def _map_file(fio: RawIOBase) -> memoryview:
+    try:
+        fd = fio.fileno()
+
+    except (AttributeError, OSError, UnsupportedOperation):
+        # Not backed by a real file (BytesIO, another wrapper, etc.), so fall back to a plain copy
+        fio.seek(0)
+        return memoryview(fio.read())
+
+    st = os.fstat(fd)
+    key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    mapping = _MAPPINGS.get(key)
+    if mapping is None:
+        mapping = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        _MAPPINGS[key] = mapping
+
+    return memoryview(mapping)
+
 class EccMeta(metaclass=ABCMeta):
     @abstractmethod
     def encode(self, data: bytes) -> bytes:
@@ -45,6 +83,10 @@ class EccMeta(metaclass=ABCMeta):
     def decode(self, data: bytes, ecc: bytes) -> bytes:
         pass
 
+    # Same as decode, but also returns the number of corrected bits/symbols
+    def correct(self, data: bytes, ecc: bytes) -> tuple[bytes, int]:
+        return self.decode(data, ecc), 0
+
     @property
     @abstractmethod
     def size(self) -> int:
@@ -211,6 +253,9 @@ class EccHamming20(EccMeta):
         return self.__bitpack_ecc(temp, self.__bit_width) if self.__bitpack else bytes(temp)
 
     def decode(self, data: bytes, ecc: bytes) -> bytes:
+        return self.correct(data, ecc)[0]
+
+    def correct(self, data: bytes, ecc: bytes) -> tuple[bytes, int]:
         if len(data) > 512:
             raise ValueError('ECC data larger than 512 bytes')
 
@@ -233,12 +278,17 @@ class EccHamming20(EccMeta):
             raise ValueError('ECC parity count must be the same as data count')
 
         temp = bytearray()
+        corrected = 0
 
         for i in range(len(data) // 0x80):
             calc_ecc = self.__do_gen_ecc(data[(i*0x80):(i*0x80)+0x80])
-            temp += self.__do_check_ecc(data[(i*0x80):(i*0x80)+0x80], ecc[(i*3):(i*3)+3], calc_ecc)[0]
+            chunk, err_bytepos, _ = self.__do_check_ecc(data[(i*0x80):(i*0x80)+0x80], ecc[(i*3):(i*3)+3], calc_ecc)
 
-        return bytes(temp)
+            temp += chunk
+            if err_bytepos != -1:
+                corrected += 1
+
+        return bytes(temp), corrected
 
     @property
     def size(self) -> int:
@@ -319,6 +369,9 @@ class EccRs(EccMeta):
         return self.__10bit_ecc_to_bytes(eccpre[1015:])
 
     def decode(self, data: bytes, ecc: bytes) -> bytes:
+        return self.correct(data, ecc)[0]
+
+    def correct(self, data: bytes, ecc: bytes) -> tuple[bytes, int]:
         if len(data) > 1015:
             raise ValueError('Data larger than 1015 bytes')
 
@@ -329,7 +382,8 @@ class EccRs(EccMeta):
         array_data = [int(x) for x in padded_data] + self.__bytes_to_10bit_ecc(ecc)
 
         try:
-            return bytes([x for x in rs.rs_correct_msg(array_data, 8, fcr=1)[0]])[-len(data):]
+            msg, _, errata_pos = rs.rs_correct_msg(array_data, 8, fcr=1)
+            return bytes([x for x in msg])[-len(data):], len(errata_pos)
 
         except rs.ReedSolomonError as e:
             raise ECCError(*e.args)
@@ -342,9 +396,19 @@ class SpareType(IntEnum):
     RIFF = 0
     STANDARD = 1
     QCOM_2K = 2
+    SEPARATE = 3
+
+# Page and erase group a reader looked at last. The prefetch worker keeps its own,
+# so it never swaps the page view out from under read_raw()/read_bbm() on the calling thread
+class _SectorCursor():
+    def __init__(self) -> None:
+        self.page_index: int = -1
+        self.page_view: memoryview = None
+        self.group_index: int = -1
+        self.group_erased: bool = False
 
 class ECCFile(RawIOBase):
-    def __init__(self, inp: str | RawIOBase, spare_offset_page_size: int=0, spare_type: int=SpareType.RIFF, bbm: int=5, page_width: int=16, ecc_algo: EccMeta=EccRs) -> None:
+    def __init__(self, inp: str | RawIOBase, spare_offset_page_size: int=0, spare_type: int=SpareType.RIFF, bbm: int=5, page_width: int=16, ecc_algo: EccMeta=EccRs, prefetch: int=0, instrument: bool=False, cache: str=None, spare_file: str | RawIOBase=None) -> None:
         self.__closed: bool = True
 
         if type(inp) == str:
@@ -354,83 +418,288 @@ class ECCFile(RawIOBase):
             self.__fio: RawIOBase = inp
 
         self.__fio.seek(0)
+        self.__map: memoryview = _map_file(self.__fio)
 
         if spare_type == SpareType.RIFF:
             if not spare_offset_page_size:
                 raise ValueError("An offset to spare data must be specified")
 
-            self.__fio.seek(spare_offset_page_size)
+            self.__spare_map: memoryview = self.__map
+            self.__spare_base: int = spare_offset_page_size
             self.__eof: int = spare_offset_page_size
-            self.__spare_io: BytesIO = BytesIO(self.__fio.read())
-            self.__fio.seek(0)
+
+        elif spare_type == SpareType.SEPARATE:
+            if spare_file is None:
+                raise ValueError("A spare (OOB) file must be specified")
+
+            # Same sector order as RIFF, only the spare area lives in its own file
+            self.__spare_fio: RawIOBase = open(spare_file, "rb") if type(spare_file) == str else spare_file
+            self.__spare_fio.seek(0)
+
+            self.__spare_map: memoryview = _map_file(self.__spare_fio)
+            self.__spare_base: int = 0
+            self.__eof: int = min(len(self.__map) // 0x200, len(self.__spare_map) // 0x10) * 0x200
 
         elif spare_type == SpareType.STANDARD:
             if not spare_offset_page_size:
                 raise ValueError("A page size must be specified")
 
-            self.__eof: int = (os.path.getsize(inp) // (spare_offset_page_size + (0x10 * (spare_offset_page_size // 0x200)))) * spare_offset_page_size
+            if spare_offset_page_size % 0x200:
+                raise ValueError("Page size must be a multiple of 512 bytes")
+
+            # 16 bytes of spare per 512-byte sector, i.e. 64 bytes OOB for 2K pages and 128 bytes for 4K pages
             self.__page_size: int = spare_offset_page_size
+            self.__oob_size: int = (spare_offset_page_size // 0x200) * 0x10
+
+            self.__eof: int = (len(self.__map) // (self.__page_size + self.__oob_size)) * self.__page_size
+            self.__erase_group: int = max(1, 0x8000 // self.__page_size) * (self.__page_size // 0x200)
 
         elif spare_type == SpareType.QCOM_2K:
-            self.__eof: int = (os.path.getsize(inp) // 0x210) * 0x200
+            self.__eof: int = (len(self.__map) // 0x210) * 0x200
 
         else:
             raise ValueError(f"Unknown spare type: {spare_type}")
 
+        if spare_type != SpareType.STANDARD:
+            self.__erase_group: int = 0x40
+
+        if prefetch < 0:
+            raise ValueError("Prefetch depth must not be negative")
+
         self.__bbm: int = bbm
         self.__page_width: int = page_width
         self.__ecc: EccMeta = ecc_algo()
         self.__cur_offset: int = 0
         self.__ecc_block: bytes = None
+        self.__ecc_sector: int = -1
         self.__spare_type: int = spare_type
+
+        # Erased groups of sectors are detected up front and never reach the ECC engine
+        self.__cursor: _SectorCursor = _SectorCursor()
+        self.__erased_count: int = 0
+
+        # Per-sector health, only kept when asked for
+        self.__stats: ECCStats = ECCStats(-(-self.__eof // 0x200)) if instrument else None
+
+        # Corrected sectors persisted across runs, keyed by the source file and the ECC parameters
+        self.__cache: ECCCache = None
+        if cache is not None:
+            self.__cache = ECCCache(cache, self.__cache_key(spare_offset_page_size), -(-self.__eof // 0x200))
+
+        # Read-ahead state, a worker thread decodes up to `prefetch` sectors ahead of the reader
+        self.__prefetch_depth: int = prefetch
+        self.__prefetch_thread: Thread = None
+        self.__prefetch_stop: Event = None
+        self.__prefetch_queue: Queue = None
+        self.__prefetch_next: int = -1
+        self.__prefetch_finalizer: finalize = None
+
         self.__closed: bool = False
 
         self.seek(0)
 
-    def __read_page(self) -> tuple[bytes, bytes]:
-        if self.__cur_offset >= self.__eof:
+    def __cache_key(self, spare_offset_page_size: int) -> bytes:
+        def identity(fio: RawIOBase, mapping: memoryview) -> tuple:
+            try:
+                st = os.fstat(fio.fileno())
+                return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+            except (AttributeError, OSError, UnsupportedOperation):
+                return (len(mapping),)
+
+        source = identity(self.__fio, self.__map)
+        if self.__spare_type == SpareType.SEPARATE:
+            source += identity(self.__spare_fio, self.__spare_map)
+
+        params = (int(self.__spare_type), spare_offset_page_size, self.__bbm, self.__page_width, type(self.__ecc).__name__)
+        return sha256(repr((source, params)).encode()).digest()
+
+    def __read_sector(self, sector: int, cursor: _SectorCursor=None) -> tuple[bytes, bytes]:
+        if sector * 0x200 >= self.__eof:
             return b"", b""
 
-        if self.__spare_type == SpareType.RIFF:
-            return self.__fio.read(0x200), self.__spare_io.read(0x10)
+        if self.__spare_type in [SpareType.RIFF, SpareType.SEPARATE]:
+            spare_offset = self.__spare_base + (sector * 0x10)
+
+            return self.__map[sector * 0x200:(sector + 1) * 0x200], bytes(self.__spare_map[spare_offset:spare_offset + 0x10])
 
         elif self.__spare_type == SpareType.STANDARD:
-            data_offset_floor = (self.__cur_offset // self.__page_size) * (self.__page_size + ((self.__page_size // 0x200) * 0x10))
+            # Take the whole page + OOB once, then split sectors and spares out of it
+            cursor = self.__cursor if cursor is None else cursor
 
-            data_offset = data_offset_floor + (((self.__cur_offset % self.__page_size) // 0x200) * 0x200)
-            spare_offset = data_offset_floor + self.__page_size + (((self.__cur_offset % self.__page_size) // 0x200) * 0x10)
+            page = (sector * 0x200) // self.__page_size
+            if page != cursor.page_index:
+                page_offset = page * (self.__page_size + self.__oob_size)
+                cursor.page_view = self.__map[page_offset:page_offset + self.__page_size + self.__oob_size]
+                cursor.page_index = page
 
-            self.__fio.seek(data_offset)
-            a = self.__fio.read(0x200)
-            self.__fio.seek(spare_offset)
+            sector = ((sector * 0x200) % self.__page_size) // 0x200
+            spare_offset = self.__page_size + (sector * 0x10)
 
-            return a, self.__fio.read(0x10)
+            return cursor.page_view[sector * 0x200:(sector + 1) * 0x200], bytes(cursor.page_view[spare_offset:spare_offset + 0x10])
 
         elif self.__spare_type == SpareType.QCOM_2K:
-            a = self.__fio.read(0x1d0 if self.__page_width == 16 else 0x1d1)
-            self.__fio.read(2 if self.__page_width == 16 else 1)
-            b = self.__fio.read(0x30 if self.__page_width == 16 else 0x2f)
+            # 0x1d0 bytes of data, the bad block marker, 0x30 bytes of data and 0xe bytes of spare (one byte shifted on x8)
+            chunk = self.__map[sector * 0x210:(sector + 1) * 0x210]
+            data_split = 0x1d0 if self.__page_width == 16 else 0x1d1
 
-            return a + b, self.__fio.read(0xe if self.__page_width == 16 else 0xf)
+            return bytes(chunk[:data_split]) + bytes(chunk[0x1d2:0x1d2 + (0x200 - data_split)]), bytes(chunk[0x1d2 + (0x200 - data_split):])
 
-    def __update_ecc_block(self) -> None:
-        ecc_d, ecc_s = self.__read_page()
+    def __check_group_erased(self, group: int) -> bool:
+        start = group * self.__erase_group
+        end = min(start + self.__erase_group, self.__eof // 0x200)
+
+        if self.__spare_type in [SpareType.RIFF, SpareType.SEPARATE]:
+            data = self.__map[start * 0x200:end * 0x200]
+            spare = self.__spare_map[self.__spare_base + (start * 0x10):self.__spare_base + (end * 0x10)]
+
+            return data == ERASED_DATA[:len(data)] and spare == ERASED_DATA[:len(spare)]
+
+        elif self.__spare_type == SpareType.STANDARD:
+            pages_size = self.__page_size + self.__oob_size
+            data = self.__map[((start * 0x200) // self.__page_size) * pages_size:((end * 0x200) // self.__page_size) * pages_size]
+
+        elif self.__spare_type == SpareType.QCOM_2K:
+            data = self.__map[start * 0x210:end * 0x210]
+
+        return data == ERASED_DATA[:len(data)]
+
+    def __is_erased(self, sector: int, ecc_d: bytes, ecc_s: bytes, cursor: _SectorCursor) -> bool:
+        group = sector // self.__erase_group
+        if group != cursor.group_index:
+            cursor.group_erased = self.__check_group_erased(group)
+            cursor.group_index = group
+
+        if cursor.group_erased:
+            return True
+
+        return ecc_d == ERASED_DATA[:len(ecc_d)] and ecc_s == ERASED_DATA[:len(ecc_s)]
+
+    # (block, status, corrections, decode time, from the cache) of a sector. Nothing is recorded here, this also
+    # runs on the prefetch worker for sectors that may never be used, see __record()
+    def __decode_sector(self, sector: int, cursor: _SectorCursor=None) -> tuple[bytes, SectorStatus, int, float, bool]:
+        cursor = self.__cursor if cursor is None else cursor
+
+        ecc_d, ecc_s = self.__read_sector(sector, cursor)
         if ecc_d == b"":
-            self.__ecc_block = ecc_d
-            return
+            return b"", SectorStatus.UNREAD, 0, 0.0, False
+
+        if self.__is_erased(sector, ecc_d, ecc_s, cursor):
+            return ecc_d, SectorStatus.ERASED, 0, 0.0, False
 
-        if self.__spare_type != SpareType.QCOM_2K:
-            bbm_mul = (self.__bbm * (2 if self.__page_width == 16 else 1))
-            ecc_s = ecc_s[:bbm_mul] + ecc_s[bbm_mul + (2 if self.__page_width == 16 else 1):]
+        if self.__cache is not None:
+            cached = self.__cache.get(sector)
+            if cached is not None:
+                return cached[0], cached[1], cached[2], 0.0, True
+
+        start_time = perf_counter()
 
         try:
-            self.__ecc_block = self.__ecc.decode(ecc_d, ecc_s[:self.__ecc.size])
+            block, corrected = self.__ecc.correct(ecc_d, (ecc_s if self.__spare_type == SpareType.QCOM_2K else _strip_bbm(ecc_s, self.__bbm, self.__page_width))[:self.__ecc.size])
+            return block, SectorStatus.CORRECTED if corrected else SectorStatus.CLEAN, corrected, perf_counter() - start_time, False
 
         except ECCError:
+            return ecc_d, SectorStatus.UNCORRECTABLE, 0, perf_counter() - start_time, False
+
+    # Counts, caches and reports a sector once the reader uses it, on the calling thread. Read-ahead
+    # that a seek throws away never gets here, so it isn't counted twice when it's decoded again
+    def __record(self, sector: int, block: bytes, status: SectorStatus, corrections: int, elapsed: float, cached: bool) -> None:
+        if status == SectorStatus.UNREAD:
+            return
+
+        if status == SectorStatus.ERASED:
+            self.__erased_count += 1
+
+        elif self.__cache is not None and not cached:
+            self.__cache.put(sector, block, status, corrections)
+
+        if status == SectorStatus.UNCORRECTABLE:
+            ecc_s = self.__read_sector(sector)[1]
+            if self.__spare_type != SpareType.QCOM_2K:
+                ecc_s = _strip_bbm(ecc_s, self.__bbm, self.__page_width)
+
+            # Still reported when it comes from the cache
             if ecc_s[:self.__ecc.size] != (b"\xff"*self.__ecc.size):
-                print(f"Uncorrectable at 0x{self.__cur_offset:08x} (custom ecc?)")
+                print(f"Uncorrectable at 0x{sector * 0x200:08x} (custom ecc?)")
+
+        if self.__stats is not None:
+            self.__stats.record(sector, status, corrections, elapsed, cached)
+
+    # Only holds the file weakly (and only while decoding), so a dropped ECCFile still gets collected
+    @staticmethod
+    def __prefetch_worker(decode: WeakMethod, eof: int, sector: int, stop: Event, queue: Queue) -> None:
+        cursor = _SectorCursor()
+
+        while sector * 0x200 < eof and not stop.is_set():
+            method = decode()
+            if method is None:
+                return
+
+            try:
+                decoded = method(sector, cursor)
+
+            except Exception as e:
+                decoded = e
+
+            method = None
+
+            while not stop.is_set():
+                try:
+                    queue.put(decoded, timeout=0.1)
+                    break
+
+                except Full:
+                    pass
+
+            if isinstance(decoded, Exception):
+                return
+
+            sector += 1
+
+    def __stop_prefetch(self) -> None:
+        if self.__prefetch_thread is not None:
+            self.__prefetch_stop.set()
+            self.__prefetch_finalizer.detach()
+
+            # The worker itself may drop the last reference and end up here
+            if self.__prefetch_thread is not current_thread():
+                self.__prefetch_thread.join()
+
+            self.__prefetch_thread = None
+            self.__prefetch_finalizer = None
+            self.__prefetch_queue = None
+            self.__prefetch_next = -1
+
+    def __start_prefetch(self, sector: int) -> None:
+        self.__prefetch_stop = Event()
+        self.__prefetch_queue = Queue(self.__prefetch_depth)
+        self.__prefetch_thread = Thread(target=self.__prefetch_worker, args=(WeakMethod(self.__decode_sector), self.__eof, sector, self.__prefetch_stop, self.__prefetch_queue), daemon=True)
+        self.__prefetch_finalizer = finalize(self, self.__prefetch_stop.set)
+        self.__prefetch_next = sector
+        self.__prefetch_thread.start()
+
+    def __update_ecc_block(self) -> None:
+        sector = self.__cur_offset // 0x200
+
+        if self.__prefetch_depth <= 0 or self.__cur_offset >= self.__eof:
+            decoded = self.__decode_sector(sector)
+
+        else:
+            # Anything but the next sector in line throws the read-ahead away
+            if sector != self.__prefetch_next:
+                self.__stop_prefetch()
+                self.__start_prefetch(sector)
+
+            decoded = self.__prefetch_queue.get()
+            if isinstance(decoded, Exception):
+                self.__stop_prefetch()
+                raise decoded
 
-            self.__ecc_block = ecc_d
+            self.__prefetch_next = sector + 1
+
+        self.__record(sector, *decoded)
+        self.__ecc_block = decoded[0]
+        self.__ecc_sector = sector
 
     def seek(self, to: int, where: int=SEEK_SET) -> None:
         if where == SEEK_SET:
@@ -443,30 +712,53 @@ class ECCFile(RawIOBase):
             if to <= 0: raise ValueError("offset in SEEK_END must not be 0")
             self.__cur_offset = self.__eof - to
 
-        if self.__closed:
-            return
+        # Sectors are decoded lazily on the next read
+        if self.__cur_offset // 0x200 != self.__ecc_sector:
+            self.__ecc_block = None
 
-        if self.__spare_type == SpareType.RIFF:
-            self.__fio.seek((to // 0x200) * 0x200)
-            self.__spare_io.seek((to // 0x200) * 0x10)
+    def tell(self) -> int:
+        return self.__cur_offset
 
-        elif self.__spare_type == SpareType.STANDARD:
-            pass
+    # Uncorrected data and the whole spare area of a sector, without touching the read position
+    def read_raw(self, sector: int) -> tuple[bytes, bytes]:
+        ecc_d, ecc_s = self.__read_sector(sector)
+        return bytes(ecc_d), ecc_s
 
-        elif self.__spare_type == SpareType.QCOM_2K:
-            self.__fio.seek((self.__cur_offset // 0x200) * 0x210)
+    # Bad block marker bytes of a sector (0xff on good blocks)
+    def read_bbm(self, sector: int) -> bytes:
+        if sector * 0x200 >= self.__eof:
+            return b""
 
-        self.__update_ecc_block()
+        if self.__spare_type == SpareType.QCOM_2K:
+            return bytes(self.__map[(sector * 0x210) + (0x1d0 if self.__page_width == 16 else 0x1d1):(sector * 0x210) + 0x1d2])
 
-    def tell(self) -> int:
-        return self.__cur_offset
+        bbm_mul = (self.__bbm * (2 if self.__page_width == 16 else 1))
+        return self.__read_sector(sector)[1][bbm_mul:bbm_mul + (2 if self.__page_width == 16 else 1)]
+
+    @property
+    def size(self) -> int:
+        return self.__eof
+
+    @property
+    def erased_sectors(self) -> int:
+        return self.__erased_count
+
+    @property
+    def stats(self) -> ECCStats | None:
+        return self.__stats
 
     def read(self, count: int=-1) -> bytes:
         if self.__closed:
             return b""
 
         temp = bytearray()
-        while (count < 0 or count > 0) and self.__ecc_block != b"":
+        while count != 0:
+            if self.__ecc_block is None:
+                self.__update_ecc_block()
+
+            if self.__ecc_block == b"":
+                break
+
             start_offset = (self.__cur_offset % 0x200)
             read_size = min(0x200 - start_offset, count) if count > 0 else 0x200 - start_offset
 
@@ -478,17 +770,28 @@ class ECCFile(RawIOBase):
             self.__cur_offset += read_size
 
             if (start_offset + read_size) == 0x200:
-                self.__update_ecc_block()
+                self.__ecc_block = None
 
         return temp
 
     def close(self) -> None:
+        self.__stop_prefetch()
         self.__fio.close()
-        if self.__spare_type == SpareType.RIFF:
-            self.__spare_io.close()
 
+        self.__map = None
+        if self.__spare_type == SpareType.SEPARATE:
+            self.__spare_fio.close()
+
+        if self.__spare_type in [SpareType.RIFF, SpareType.SEPARATE]:
+            self.__spare_map = None
+        if self.__cache is not None:
+            self.__cache.close()
+
+        self.__cursor.page_view = None
+
+        self.__ecc_block = None
         self.__closed = True
 
     def __del__(self) -> None:
         if not self.__closed:
-            self.close()
\ No newline at end of file
+            self.close()
@@ -0,0 +1,74 @@
+from construct import Struct, Const, Bytes, Int64ul
+from .ecc_stats import SectorStatus
+import mmap
+import os
+
+__all__ = [
+    'ECCCache'
+]
+
+ECC_CACHE_HEADER = Struct(
+    "magic" / Const(b"EFSECCC3"),
+    "key" / Bytes(32),
+    "sector_count" / Int64ul,
+)
+
+ECC_CACHE_ALIGN = 0x1000
+
+# Sidecar file holding corrected sectors of an ECC-wrapped dump
+# Layout: header, one status byte per sector (0 when not cached), one corrections byte per sector,
+# then the sector data at its natural offset
+# The file is created sparse, so only sectors that were actually decoded take up space, and
+# a byte per sector (instead of a bit) lets several processes fill disjoint ranges without locking.
+# Status and corrections are kept so a cached run gives the same health report as the first one
+class ECCCache():
+    def __init__(self, filename: str, key: bytes, sector_count: int) -> None:
+        self.__closed: bool = True
+
+        self.sector_count: int = sector_count
+        self.__valid_offset: int = ECC_CACHE_ALIGN
+        self.__corrections_offset: int = self.__valid_offset + (((sector_count + ECC_CACHE_ALIGN - 1) // ECC_CACHE_ALIGN) * ECC_CACHE_ALIGN)
+        self.__data_offset: int = self.__corrections_offset + (self.__corrections_offset - self.__valid_offset)
+
+        total_size = self.__data_offset + (sector_count * 0x200)
+        header = ECC_CACHE_HEADER.build({"key": key, "sector_count": sector_count})
+
+        self.__fio = open(filename, "r+b" if os.path.exists(filename) else "w+b")
+
+        # A different source or different ECC parameters invalidate everything
+        if self.__fio.read(len(header)) != header or os.fstat(self.__fio.fileno()).st_size != total_size:
+            self.__fio.truncate(0)
+            self.__fio.truncate(total_size)
+            self.__fio.seek(0)
+            self.__fio.write(header)
+            self.__fio.flush()
+
+        self.__map = mmap.mmap(self.__fio.fileno(), total_size, access=mmap.ACCESS_WRITE)
+        self.__closed = False
+
+    def get(self, sector: int) -> tuple[bytes, SectorStatus, int] | None:
+        status = self.__map[self.__valid_offset + sector]
+        if not status:
+            return None
+
+        return self.__map[self.__data_offset + (sector * 0x200):self.__data_offset + ((sector + 1) * 0x200)], SectorStatus(status), self.__map[self.__corrections_offset + sector]
+
+    def put(self, sector: int, data: bytes, status: SectorStatus, corrections: int=0) -> None:
+        # Data and corrections first, then the status, so a sector is never marked valid before it's written
+        self.__map[self.__data_offset + (sector * 0x200):self.__data_offset + (sector * 0x200) + len(data)] = data
+        self.__map[self.__corrections_offset + sector] = min(corrections, 0xff)
+        self.__map[self.__valid_offset + sector] = status
+
+    @property
+    def cached_sectors(self) -> int:
+        return self.sector_count - self.__map[self.__valid_offset:self.__valid_offset + self.sector_count].count(0)
+
+    def close(self) -> None:
+        if not self.__closed:
+            self.__map.flush()
+            self.__map.close()
+            self.__fio.close()
+            self.__closed = True
+
+    def __del__(self) -> None:
+        self.close()
@@ -0,0 +1,121 @@
+from .ecc import ECCFile, EccMeta, EccRs, EccHamming20, EccHamming20Bitpack, EccHamming20Bitpack16, SpareType, ERASED_DATA, _strip_bbm
+from io import RawIOBase
+import os
+
+__all__ = [
+    'ProbeResult',
+    'probe_layout'
+]
+
+PROBE_ALGOS: list[EccMeta] = [EccRs, EccHamming20, EccHamming20Bitpack, EccHamming20Bitpack16]
+
+class ProbeResult():
+    def __init__(self, spare_type: SpareType, spare_offset_page_size: int, bbm: int, page_width: int, ecc_algo: EccMeta) -> None:
+        self.spare_type: SpareType = spare_type
+        self.spare_offset_page_size: int = spare_offset_page_size
+        self.bbm: int = bbm
+        self.page_width: int = page_width
+        self.ecc_algo: EccMeta = ecc_algo
+        self.clean: int = 0
+        self.samples: int = 0
+
+    @property
+    def score(self) -> float:
+        return self.clean / self.samples if self.samples else 0.0
+
+    def __repr__(self) -> str:
+        return "<{klass} {attrs}>".format(
+            klass=self.__class__.__name__,
+            attrs=" ".join("{}={!r}".format(k, v) for k, v in self.__dict__.items()),
+        )
+
+def _layouts(size: int, page_sizes: list[int], spare_file: str | RawIOBase) -> list[tuple[SpareType, int, list[int]]]:
+    temp = []
+
+    # Every layout carries 16 bytes of spare per 512 bytes of data
+    if spare_file is not None:
+        temp.append((SpareType.SEPARATE, 0, [16, 8]))
+
+    if size % 0x210 == 0:
+        temp.append((SpareType.RIFF, (size // 0x210) * 0x200, [16, 8]))
+
+    for page_size in page_sizes:
+        if size % (page_size + ((page_size // 0x200) * 0x10)) == 0:
+            temp.append((SpareType.STANDARD, page_size, [16, 8]))
+
+    if size % 0x210 == 0:
+        # The QCOM layout itself differs between x8 and x16, so the width is part of the layout
+        temp.append((SpareType.QCOM_2K, 0, [16]))
+        temp.append((SpareType.QCOM_2K, 0, [8]))
+
+    return temp
+
+# ECCFile closes what it's given, so hand it its own handle
+def _reopen(inp: str | RawIOBase) -> str | RawIOBase:
+    return inp if inp is None or type(inp) == str else open(os.dup(inp.fileno()), "rb")
+
+def _sample(nand: ECCFile, count: int) -> list[tuple[bytes, bytes]]:
+    sectors = nand.size // 0x200
+    temp = []
+
+    if sectors <= 0:
+        return temp
+
+    # Evenly spread starting points, each walking forward to the next non-erased sector
+    step = max(1, sectors // count)
+    for start in range(0, sectors, step):
+        for sector in range(start, min(start + step, start + 0x40, sectors)):
+            data, spare = nand.read_raw(sector)
+            if data != ERASED_DATA[:len(data)] or spare != ERASED_DATA[:len(spare)]:
+                temp.append((data, spare))
+                break
+
+        if len(temp) >= count:
+            break
+
+    return temp
+
+def probe_layout(inp: str | RawIOBase, samples: int=256, bbms: list[int]=[5, 0, 1, 2, 3, 4, 6, 7], page_sizes: list[int]=[0x200, 0x800, 0x1000], spare_file: str | RawIOBase=None, quick_samples: int=16) -> list[ProbeResult]:
+    size = os.path.getsize(inp) if type(inp) == str else os.fstat(inp.fileno()).st_size
+
+    temp = []
+    engines = {algo: algo() for algo in PROBE_ALGOS}
+
+    for spare_type, spare_offset_page_size, widths in _layouts(size, page_sizes, spare_file):
+        nand = ECCFile(_reopen(inp), spare_offset_page_size, spare_type, 5, widths[0], EccHamming20, spare_file=_reopen(spare_file))
+        sampled = _sample(nand, samples)
+        nand.close()
+
+        results = [
+            ProbeResult(spare_type, spare_offset_page_size, bbm, width, algo)
+            for width in widths for bbm in (bbms if spare_type != SpareType.QCOM_2K else [0]) for algo in PROBE_ALGOS
+            if not (algo == EccHamming20Bitpack and width == 16) and not (algo == EccHamming20Bitpack16 and width == 8)
+        ]
+        codes: dict[tuple[int, EccMeta], bytes] = {}
+
+        def check(index: int, results: list[ProbeResult]) -> None:
+            data, spare = sampled[index]
+
+            for r in results:
+                if (index, r.ecc_algo) not in codes:
+                    codes[(index, r.ecc_algo)] = engines[r.ecc_algo].encode(data)
+
+                code = codes[(index, r.ecc_algo)]
+                ecc_s = spare if spare_type == SpareType.QCOM_2K else _strip_bbm(spare, r.bbm, r.page_width)
+
+                r.samples += 1
+                if ecc_s[:len(code)] == code:
+                    r.clean += 1
+
+        # Try everything on a handful of sectors first, then only keep going with what matched at least once
+        for i in range(min(quick_samples, len(sampled))):
+            check(i, results)
+
+        results = [r for r in results if r.clean > 0]
+        for i in range(min(quick_samples, len(sampled)), len(sampled)):
+            check(i, results)
+
+        temp.extend(results)
+
+    temp.sort(key=lambda r: r.score, reverse=True)
+    return temp
@@ -0,0 +1,110 @@
+from array import array
+from enum import IntEnum
+from typing import TextIO
+import json
+
+__all__ = [
+    'SectorStatus',
+    'ECCStats'
+]
+
+class SectorStatus(IntEnum):
+    UNREAD = 0
+    CLEAN = 1
+    CORRECTED = 2
+    UNCORRECTABLE = 3
+    ERASED = 4
+
+class ECCStats():
+    def __init__(self, sector_count: int, first_sector: int=0) -> None:
+        self.sector_count: int = sector_count
+        self.first_sector: int = first_sector
+
+        # One slot per 512-byte sector: status, corrected bits/symbols, decode time in seconds
+        # and whether it came from the cache (the status is then the one it was cached with)
+        self.status: array = array('B', bytes(sector_count))
+        self.corrections: array = array('H', bytes(sector_count * 2))
+        self.decode_time: array = array('f', bytes(sector_count * 4))
+        self.cached: array = array('B', bytes(sector_count))
+
+    def record(self, sector: int, status: SectorStatus, corrections: int=0, elapsed: float=0.0, cached: bool=False) -> None:
+        index = sector - self.first_sector
+
+        self.status[index] = status
+        self.corrections[index] = min(corrections, 0xffff)
+        self.decode_time[index] = elapsed
+        self.cached[index] = cached
+
+    def section(self, start: int, end: int) -> "ECCStats":
+        temp = ECCStats(end - start, start)
+
+        temp.status[:] = self.status[start - self.first_sector:end - self.first_sector]
+        temp.corrections[:] = self.corrections[start - self.first_sector:end - self.first_sector]
+        temp.decode_time[:] = self.decode_time[start - self.first_sector:end - self.first_sector]
+        temp.cached[:] = self.cached[start - self.first_sector:end - self.first_sector]
+
+        return temp
+
+    def update(self, other: "ECCStats") -> None:
+        for i, status in enumerate(other.status):
+            if status != SectorStatus.UNREAD:
+                self.record(other.first_sector + i, status, other.corrections[i], other.decode_time[i], other.cached[i])
+
+    def summary(self, start: int=0, end: int=-1) -> dict[str, int | float]:
+        start -= self.first_sector
+        end = self.sector_count if end == -1 else end - self.first_sector
+
+        temp = {s.name.lower(): self.status[start:end].count(s) for s in SectorStatus}
+        temp["cached"] = self.cached[start:end].count(1)
+        temp["corrections"] = sum(self.corrections[start:end])
+        temp["decode_time"] = sum(self.decode_time[start:end])
+
+        return temp
+
+    def block_summary(self, sectors_per_block: int) -> list[dict[str, int | float]]:
+        temp = []
+
+        for start in range(self.first_sector, self.first_sector + self.sector_count, sectors_per_block):
+            block = {"block": start // sectors_per_block}
+            block.update(self.summary(start, min(start + sectors_per_block, self.first_sector + self.sector_count)))
+            temp.append(block)
+
+        return temp
+
+    def bad_blocks(self, sectors_per_block: int) -> list[int]:
+        return [b["block"] for b in self.block_summary(sectors_per_block) if b["uncorrectable"] > 0]
+
+    def to_json(self, fp: TextIO, sectors_per_block: int=0x100) -> None:
+        # Only the sectors that are worth looking at are listed individually
+        json.dump({
+            "sector_size": 0x200,
+            "sectors_per_block": sectors_per_block,
+            "summary": self.summary(),
+            "bad_blocks": self.bad_blocks(sectors_per_block),
+            "blocks": self.block_summary(sectors_per_block),
+            "sectors": [
+                {"sector": self.first_sector + i, "status": SectorStatus(status).name.lower(), "corrections": self.corrections[i], "decode_time": self.decode_time[i], "cached": bool(self.cached[i])}
+                for i, status in enumerate(self.status) if status in [SectorStatus.CORRECTED, SectorStatus.UNCORRECTABLE]
+            ],
+        }, fp, indent=2)
+
+    def to_csv(self, fp: TextIO) -> None:
+        fp.write("sector,offset,status,corrections,decode_time,cached\n")
+
+        for i, status in enumerate(self.status):
+            if status != SectorStatus.UNREAD:
+                fp.write(f"{self.first_sector + i},0x{(self.first_sector + i) * 0x200:08x},{SectorStatus(status).name.lower()},{self.corrections[i]},{self.decode_time[i]:.6f},{self.cached[i]}\n")
+
+    def save(self, filename: str, sectors_per_block: int=0x100) -> None:
+        with open(filename, "w", newline="") as f:
+            if filename.lower().endswith(".csv"):
+                self.to_csv(f)
+
+            else:
+                self.to_json(f, sectors_per_block)
+
+    def __repr__(self) -> str:
+        return "<{klass} {attrs}>".format(
+            klass=self.__class__.__name__,
+            attrs=" ".join("{}={!r}".format(k, v) for k, v in self.summary().items()),
+        )
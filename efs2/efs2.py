@@ -6,9 +6,94 @@ from .pm_nor import NORLog, NORPM
 from .info import EFSInfo
 from .db import Database, DatabaseItem
 from .inode import INode, InlineINode, INodeReader
-from stat import S_ISDIR, S_ISLNK, S_IFLNK, S_IFREG
+from stat import S_ISDIR, S_ISLNK, S_ISREG, S_IFLNK, S_IFREG
 from datetime import datetime
-from io import BytesIO
+from io import BytesIO, UnsupportedOperation
+from .utils import copy_range_at
+from typing import Iterator, Iterable, Callable
+from mmap import mmap
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
+from collections import deque
+from threading import RLock
+import hashlib
+import os
+import re
+
+# A directory entry found by EFS2.scandir()/walk(), carrying everything needed to open it without a lookup
+class EFS2Entry():
+    def __init__(self, fs: "EFS2", path: str, inode: INode) -> None:
+        self.fs: EFS2 = fs
+        self.path: str = path
+        self.name: str = inode.name
+        self.inode: INode = inode
+
+    def is_dir(self) -> bool:
+        return S_ISDIR(self.inode.mode)
+
+    def is_symlink(self) -> bool:
+        return S_ISLNK(self.inode.mode)
+
+    def open(self, follow_symlinks: bool=True) -> RawIOBase:
+        if type(self.inode) == InlineINode:
+            if S_ISLNK(self.inode.mode) and follow_symlinks:
+                return self.fs.open(self.inode.data.decode(self.fs.encoding))
+
+            return BytesIO(self.inode.data)
+
+        return INodeReader(self.inode)
+
+    # Metadata as JSON types, for machine-readable listings (one object per line)
+    def to_dict(self) -> dict:
+        inode = self.inode
+        inline = type(inode) == InlineINode
+
+        temp = {
+            "path": self.path,
+            "mode": inode.mode,
+            "size": inode.file_size,
+            "uid": getattr(inode, "user_id", 0),
+            "gid": inode.group_id,
+            "mtime": int(inode.modified_time.timestamp()),
+            "ctime": int(inode.created_time.timestamp()),
+            "atime": int(inode.accessed_time.timestamp()) if hasattr(inode, "accessed_time") else None,
+            "generation": inode.generation,
+            "blocks": inode.blocks,
+            "inode": getattr(inode, "id", None),
+            "inline": inline and not S_ISDIR(inode.mode),
+            "symlink": self.is_symlink(),
+        }
+
+        if self.is_symlink():
+            temp["target"] = inode.data.decode(self.fs.encoding)
+
+        return temp
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} {self.path!r}>"
+
+# Largest single read when extracting physically adjacent pages together
+EXTRACT_READ_SIZE = 0x100000
+# Most outputs extract_many keeps open at once, well under the usual limit of 1024 descriptors
+EXTRACT_MAX_OPEN = 0x40
+# Files are read this much at a time when hashing, with the I/O lock held
+HASH_READ_SIZE = 0x40000
+# grep searches files in chunks this big, overlapping by the longest match it can find
+# (the pattern itself, or GREP_MAX_MATCH for regular expressions)
+GREP_CHUNK_SIZE = 0x40000
+GREP_MAX_MATCH = 0x1000
+
+# Matches starting in [start, end) of a chunk, buf holding the file from offset base on, as
+# (offset, end offset, match, before, after). Module level so it can run on a process pool
+def _grep_chunk(pattern: re.Pattern, buf: bytes, base: int, start: int, end: int, context: int) -> list[tuple[int, int, bytes, bytes, bytes]]:
+    temp = []
+
+    for m in pattern.finditer(buf, start - base):
+        if base + m.start() >= end:
+            break
+
+        temp.append((base + m.start(), base + m.end(), m.group(), buf[max(0, m.start() - context):m.start()], buf[m.end():m.end() + context]))
+
+    return temp
 
 class EFS2():
     def __init__(self, file: RawIOBase, base_offset: int=-1, super: int=-1, io_wrapper: RawIOBase=None, encoding: str="latin-1", log=True, end_offset: int=-1, errors: bool=True) -> None:
@@ -16,6 +101,7 @@ class EFS2():
         self.__super: Superblock = None
         self._closed: bool = True
         self._errors: bool = errors
+        self._io_lock: RLock = RLock() # Readers share one file position, hold this around seek + read from other threads
 
         self.encoding: str = encoding
 
@@ -186,18 +272,59 @@ class EFS2():
 
         return temp
 
-    def ls_recursive(self, pathname: str="") -> list[tuple[str, INode]]:
+    def __scandir(self, dir: int, prefix: str) -> Iterator[EFS2Entry]:
+        for n in self._db.list(dir):
+            # "." and "..", no need to parse their inodes
+            if n.name in [b"", b"\0"]:
+                continue
+
+            try:
+                inode = self.__classify_inode(n)
+
+            except Exception as e:
+                if self._errors: raise
+                print(f"cannot open file {n.name.decode(self.encoding)}: {e}")
+                continue
+
+            yield EFS2Entry(self, prefix + self.__format_name(inode), inode)
+
+    def scandir(self, pathname: str="") -> Iterator[EFS2Entry]:
         if self._closed:
             raise Exception("Cannot perform when closed")
 
-        temp = []
-        for name, info in self.ls(pathname):
-            if name not in [".", ".."]:
-                temp.append((pathname + name, info))
-                if S_ISDIR(info.mode):
-                    temp.extend(self.ls_recursive(pathname + name))
+        if len(pathname) <= 0:
+            yield from self.__scandir(self._cur_db, "")
+            return
 
-        return temp
+        file, _ = self.__resolve(pathname)
+
+        if not S_ISDIR(file.mode):
+            yield EFS2Entry(self, pathname, file)
+            return
+
+        yield from self.__scandir(file.id, pathname if pathname.endswith("/") else pathname + "/")
+
+    # Depth-first walk of a tree, descending by inode id so nothing is looked up by path again
+    def walk(self, pathname: str="") -> Iterator[EFS2Entry]:
+        stack = [self.scandir(pathname)]
+
+        while len(stack) > 0:
+            entry = next(stack[-1], None)
+
+            if entry is None:
+                stack.pop()
+                continue
+
+            yield entry
+
+            if entry.is_dir():
+                stack.append(self.__scandir(entry.inode.id, entry.path))
+
+    def ls_recursive(self, pathname: str="") -> list[tuple[str, INode]]:
+        if self._closed:
+            raise Exception("Cannot perform when closed")
+
+        return [(e.path, e.inode) for e in self.walk(pathname)]
 
     def cd(self, pathname: str="") -> None:
         if self._closed:
@@ -245,6 +372,426 @@ class EFS2():
         else:
             return INodeReader(file)
 
+    # Page runs of a file: (offset in the image, length, offset in the file), physically contiguous pages merged
+    def __file_runs(self, inode: INode) -> list[tuple[int, int, int]]:
+        page_size = inode.pm.super.page_size
+        clusters = inode.clusters()
+        temp = []
+
+        for file_offset in range(0, inode.file_size, page_size):
+            offset = inode.pm.forward_file_offset(clusters[file_offset // page_size])
+            length = min(page_size, inode.file_size - file_offset)
+
+            if len(temp) > 0 and temp[-1][0] + temp[-1][1] == offset and temp[-1][2] + temp[-1][1] == file_offset:
+                temp[-1] = (temp[-1][0], temp[-1][1] + length, temp[-1][2])
+
+            else:
+                temp.append((offset, length, file_offset))
+
+        return temp
+
+    @staticmethod
+    def __fileno(file: RawIOBase) -> int | None:
+        try:
+            return file.fileno()
+
+        except (AttributeError, OSError, UnsupportedOperation):
+            return None
+
+    # Writes the pieces (offset, length, file_offset, index in batch) in the order given. Outputs are
+    # opened at the first piece of their file and closed after its last, returns how many were written
+    def __extract_pieces(self, batch: list[EFS2Entry], pieces: list[tuple[int, int, int, int]], sink: Callable[[EFS2Entry], RawIOBase], done: Callable[[EFS2Entry], None] | None, in_fd: int | None) -> int:
+        last = {p[3]: i for i, p in enumerate(pieces)}
+        outputs: dict[int, tuple[RawIOBase | None, int | None]] = {}
+        count = 0
+
+        def output(index: int) -> tuple[RawIOBase | None, int | None]:
+            if index not in outputs:
+                try:
+                    out = sink(batch[index])
+
+                except Exception as e:
+                    print(f"cannot extract file {batch[index].path}: {e}")
+                    out = None
+
+                # Files going to real files are copied in the kernel
+                outputs[index] = (out, self.__fileno(out) if in_fd is not None and out is not None else None)
+
+            return outputs[index]
+
+        def fail(index: int, e: Exception) -> None:
+            print(f"cannot extract file {batch[index].path}: {e}")
+
+            out, _ = outputs[index]
+            if out is not None:
+                out.close()
+
+            outputs[index] = (None, None)
+
+        def finish(i: int) -> None:
+            nonlocal count
+
+            index = pieces[i][3]
+            if last[index] == i:
+                out, _ = outputs.pop(index)
+
+                if out is not None:
+                    out.close()
+                    count += 1
+
+                    if done is not None:
+                        done(batch[index])
+
+        file = self._pm.file
+        page_size = self._pm.super.page_size
+
+        i = 0
+        while i < len(pieces):
+            offset, length, file_offset, index = pieces[i]
+            out, out_fd = output(index)
+
+            if out is None or out_fd is not None:
+                if out is not None:
+                    try:
+                        copy_range_at(in_fd, out_fd, offset, file_offset, length)
+
+                    except Exception as e:
+                        fail(index, e)
+
+                finish(i)
+                i += 1
+                continue
+
+            # Merge runs that follow each other even across files, as long as that doesn't open too many outputs
+            # (reading through the tail of a partially used page is cheaper than seeking over it)
+            start = offset
+            end = offset + length
+
+            j = i + 1
+            while j < len(pieces) and end <= pieces[j][0] < end + page_size and end - start < EXTRACT_READ_SIZE and (pieces[j][3] in outputs or len(outputs) < EXTRACT_MAX_OPEN) and output(pieces[j][3])[1] is None:
+                end = pieces[j][0] + pieces[j][1]
+                j += 1
+
+            try:
+                if file.tell() != start:
+                    file.seek(start)
+
+                data = file.read(end - start)
+
+            except Exception as e:
+                for k in range(i, j):
+                    if outputs[pieces[k][3]][0] is not None:
+                        fail(pieces[k][3], e)
+
+                data = None
+
+            for k in range(i, j):
+                offset, length, file_offset, index = pieces[k]
+                out, _ = outputs[index]
+
+                if data is not None and out is not None:
+                    try:
+                        if out.tell() != file_offset:
+                            out.seek(file_offset)
+
+                        out.write(data[offset - start:offset - start + length])
+
+                    except Exception as e:
+                        fail(index, e)
+
+                finish(k)
+
+            i = j
+
+        return count
+
+    def __extract_batch(self, batch: list[EFS2Entry], sink: Callable[[EFS2Entry], RawIOBase], done: Callable[[EFS2Entry], None] | None, zero_copy: bool) -> int:
+        pieces = []
+        count = 0
+
+        # Only a plain image file holds the data as-is (not behind ECC, bad block or sparse wrappers)
+        in_fd = self.__fileno(self._pm.file) if zero_copy else None
+
+        # 01 - Collect the page runs of every file, files without any are written right away.
+        # A file that can't be read is reported and skipped, like the exporters do
+        for index, entry in enumerate(batch):
+            try:
+                if type(entry.inode) == InlineINode:
+                    # Inline data (and symlink targets)
+                    data = entry.open().read()
+                    runs = []
+
+                else:
+                    data = b""
+                    runs = self.__file_runs(entry.inode)
+
+                if len(runs) <= 0:
+                    out = sink(entry)
+
+                    if out is not None:
+                        out.write(data)
+                        out.close()
+                        count += 1
+
+                        if done is not None:
+                            done(entry)
+
+            except Exception as e:
+                print(f"cannot extract file {entry.path}: {e}")
+                continue
+
+            pieces.extend((offset, length, file_offset, index) for offset, length, file_offset in runs)
+
+        # 02 - Write in physical order. A file keeps its output open from its first piece to its last,
+        # files that would go over EXTRACT_MAX_OPEN open outputs wait for another pass
+        pieces.sort(key=lambda r: r[0])
+
+        while len(pieces) > 0:
+            last = {p[3]: i for i, p in enumerate(pieces)}
+            admitted = set()
+            waiting = set()
+            chosen = []
+            deferred = []
+            slots = 0
+
+            for i, p in enumerate(pieces):
+                if p[3] not in admitted:
+                    if slots >= EXTRACT_MAX_OPEN or p[3] in waiting:
+                        waiting.add(p[3])
+                        deferred.append(p)
+                        continue
+
+                    admitted.add(p[3])
+                    slots += 1
+
+                chosen.append(p)
+
+                if last[p[3]] == i:
+                    slots -= 1
+
+            count += self.__extract_pieces(batch, chosen, sink, done, in_fd)
+            pieces = deferred
+
+        return count
+
+    # Where a file lives in the image: (offset, length) runs of physically contiguous pages, in file order.
+    # Offsets are in the file given to EFS2, so they're only raw flash offsets when it isn't wrapped (ECC etc.)
+    def extents(self, pathname: str | EFS2Entry) -> list[tuple[int, int]]:
+        if self._closed:
+            raise Exception("Cannot perform when closed")
+
+        inode = pathname.inode if type(pathname) == EFS2Entry else self.stat(pathname)
+
+        if not S_ISREG(inode.mode):
+            raise TypeError("Not a file")
+
+        if type(inode) == InlineINode:
+            return [] # Stored inside the directory database
+
+        temp = []
+        for offset, length, _ in self.__file_runs(inode):
+            if len(temp) > 0 and temp[-1][0] + temp[-1][1] == offset:
+                temp[-1] = (temp[-1][0], temp[-1][1] + length)
+
+            else:
+                temp.append((offset, length))
+
+        return temp
+
+    def __hash_entry(self, entry: EFS2Entry, algorithms: list[str]) -> dict:
+        temp = [hashlib.new(a) for a in algorithms]
+
+        if entry.is_symlink():
+            # The link itself, not what it points to
+            for h in temp:
+                h.update(entry.inode.data)
+
+        else:
+            with self._io_lock:
+                reader = entry.open()
+
+            while True:
+                with self._io_lock:
+                    data = reader.read(HASH_READ_SIZE)
+
+                if len(data) <= 0:
+                    break
+
+                # hashlib lets go of the GIL on big buffers, so this runs in parallel
+                for h in temp:
+                    h.update(data)
+
+        return {
+            "path": entry.path,
+            "mode": entry.inode.mode,
+            "size": entry.inode.file_size,
+            "inode": getattr(entry.inode, "id", None),
+            "generation": entry.inode.generation,
+            **{a: h.hexdigest() for a, h in zip(algorithms, temp)},
+        }
+
+    # Digests of every file and symlink below pathname, hashed on a thread pool and yielded in walk order
+    def hash_files(self, pathname: str="", algorithms: list[str]=["sha256"], jobs: int=0) -> Iterator[dict]:
+        if self._closed:
+            raise Exception("Cannot perform when closed")
+
+        jobs = jobs if jobs > 0 else os.cpu_count()
+        walk = self.walk(pathname)
+        pending: deque[Future] = deque()
+
+        with ThreadPoolExecutor(jobs) as pool:
+            while True:
+                # The walk reads the database, so it takes the lock like the workers
+                with self._io_lock:
+                    entry = next(walk, None)
+
+                if entry is None:
+                    break
+
+                if entry.is_dir():
+                    continue
+
+                pending.append(pool.submit(self.__hash_entry, entry, algorithms))
+
+                while len(pending) > jobs * 4:
+                    yield pending.popleft().result()
+
+            while len(pending) > 0:
+                yield pending.popleft().result()
+
+    # Chunks of a file as (buf, base, start, end): matches are taken from [start, end), buf holds the file from
+    # offset base on, with context bytes before start and keep bytes after end for matches running past it
+    def __grep_chunks(self, entry: EFS2Entry, keep: int, context: int) -> Iterator[tuple[bytes, int, int, int]]:
+        if entry.is_symlink():
+            yield entry.inode.data, 0, 0, len(entry.inode.data)
+            return
+
+        with self._io_lock:
+            reader = entry.open()
+
+        buf = b""
+        base = 0
+        start = 0
+        eof = False
+
+        while True:
+            while not eof and base + len(buf) < start + GREP_CHUNK_SIZE + keep:
+                with self._io_lock:
+                    data = reader.read(GREP_CHUNK_SIZE)
+
+                eof = len(data) <= 0
+                buf += data
+
+            end = min(start + GREP_CHUNK_SIZE, base + len(buf))
+            if end <= start:
+                return
+
+            yield buf[:end + keep - base], base, start, end
+
+            if eof and end == base + len(buf):
+                return
+
+            drop = max(0, end - context - base)
+            buf = buf[drop:]
+            base += drop
+            start = end
+
+    # Searches the contents of every file below pathname (inline ones and symlink targets included
+    # unless turned off). Files are read on the calling thread and their chunks searched on a process pool.
+    # pattern is bytes or a compiled bytes regular expression, matches come in walk order with
+    # their offset and up to context bytes around them
+    def grep(self, pattern: bytes | re.Pattern, pathname: str="", context: int=16, jobs: int=0, inline: bool=True, symlinks: bool=True) -> Iterator[dict]:
+        if self._closed:
+            raise Exception("Cannot perform when closed")
+
+        if isinstance(pattern, re.Pattern):
+            overlap = GREP_MAX_MATCH
+
+        else:
+            overlap = len(pattern)
+            pattern = re.compile(re.escape(pattern))
+
+        jobs = jobs if jobs > 0 else os.cpu_count()
+        walk = self.walk(pathname)
+        pending: deque[tuple[EFS2Entry, bytes, int, int, Future]] = deque()
+
+        # Where the next match of the current file may start, past the end of the last one reported
+        resume_path = None
+        resume = 0
+
+        def collect() -> list[dict]:
+            nonlocal resume_path, resume
+            entry, buf, base, end, future = pending.popleft()
+            found = future.result()
+
+            if entry.path != resume_path:
+                resume_path = entry.path
+                resume = 0
+
+            # The last match of the previous chunk ran into this one, a sequential search would go on from its end
+            if len(found) > 0 and found[0][0] < resume:
+                found = _grep_chunk(pattern, buf, base, resume, end, context)
+
+            if len(found) > 0:
+                resume = max(found[-1][1], found[-1][0] + 1)
+
+            return [{"path": entry.path, "offset": offset, "match": match, "before": before, "after": after} for offset, _, match, before, after in found]
+
+        with ProcessPoolExecutor(jobs) as pool:
+            while True:
+                with self._io_lock:
+                    entry = next(walk, None)
+
+                if entry is None:
+                    break
+
+                if entry.is_dir() or (entry.is_symlink() and not symlinks) or (not inline and type(entry.inode) == InlineINode and not entry.is_symlink()):
+                    continue
+
+                for buf, base, start, end in self.__grep_chunks(entry, overlap + context, context):
+                    pending.append((entry, buf, base, end, pool.submit(_grep_chunk, pattern, buf, base, start, end, context)))
+
+                    while len(pending) > jobs * 4:
+                        yield from collect()
+
+            while len(pending) > 0:
+                yield from collect()
+
+    # Extracts many files at once, reading their pages in physical order instead of file by file.
+    # sink returns a seekable output for every file (or None to skip it), which is closed once written.
+    # Files that can't be read or written are reported and skipped, the rest carry on, and done (if given)
+    # is called with every entry whose output was written completely and closed
+    # With zero_copy, files going from a plain image file to real files are copied with copy_file_range
+    def extract_many(self, entries: Iterable[str | EFS2Entry], sink: Callable[[EFS2Entry], RawIOBase], batch_size: int=0x400, zero_copy: bool=True, done: Callable[[EFS2Entry], None]=None) -> int:
+        if self._closed:
+            raise Exception("Cannot perform when closed")
+
+        count = 0
+        batch = []
+
+        for entry in entries:
+            if type(entry) == str:
+                try:
+                    entry = EFS2Entry(self, entry, self.stat(entry))
+
+                except Exception as e:
+                    print(f"cannot extract file {entry}: {e}")
+                    continue
+
+            if entry.is_dir():
+                continue
+
+            batch.append(entry)
+
+            if len(batch) >= batch_size:
+                count += self.__extract_batch(batch, sink, done, zero_copy)
+                batch = []
+
+        if len(batch) > 0:
+            count += self.__extract_batch(batch, sink, done, zero_copy)
+
+        return count
+
     def set_encoding(self, encoding: str) -> None:
         self._db.set_encoding(encoding)
         self.encoding = encoding
@@ -260,15 +807,26 @@ class EFS2():
         if not self._closed:
             self.close()
 
-def compute_efs2_size(data: bytes):
+def compute_efs2_size(data: bytes | mmap | RawIOBase):
     cur_superblock_offset = 0
     superblock_offsets = []
     superblocks = []
     super = None
 
+    if hasattr(data, "__getitem__"):
+        read_block = lambda offset: data[offset:offset+0x4000]
+
+    else:
+        # File handles are scanned from their current position, one superblock-sized read at a time
+        base_offset = data.tell()
+
+        def read_block(offset: int) -> bytes:
+            data.seek(base_offset + offset)
+            return data.read(0x4000)
+
     while True:
         try:
-            sb = Superblock(data[cur_superblock_offset:cur_superblock_offset+0x4000])
+            sb = Superblock(read_block(cur_superblock_offset))
 
             superblock_offsets.append(cur_superblock_offset)
             superblocks.append(sb)
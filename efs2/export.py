@@ -0,0 +1,268 @@
+from .efs2 import EFS2, EFS2Entry
+from .inode import INode
+from .manifest import Manifest, new_hash, hash_entry, select_changed
+from .store import ObjectStore
+from concurrent.futures import ThreadPoolExecutor, Future
+from collections import deque
+from stat import S_ISDIR, S_ISLNK, S_IMODE
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED, ZIP_STORED, ZIP64_LIMIT
+import tarfile
+from typing import Callable, Iterator
+from io import RawIOBase
+import traceback
+import zlib
+import os
+
+__all__ = [
+    'export_zip',
+    'export_tar',
+    'export_store'
+]
+
+# Files are copied through a buffer this big, and only files up to STREAM_THRESHOLD are read
+# whole (to be compressed on the pool), so memory use doesn't depend on the file sizes
+EXPORT_BUFFER_SIZE = 0x10000
+STREAM_THRESHOLD = 0x100000
+
+def _zip_info(name: str, inode: INode, compress_type: int) -> ZipInfo:
+    date = inode.modified_time.timetuple()[:6]
+
+    # Directories end with a slash, and the mode goes in the high bits of the external attributes
+    # (plus the MS-DOS directory flag) like ZipFile.write() does, or unzip restores everything as ----------
+    info = ZipInfo(filename=name.strip("/") + ("/" if S_ISDIR(inode.mode) else ""), date_time=date if date[0] >= 1980 else (1980, 1, 1, 0, 0, 0))
+    info.compress_type = compress_type
+    info.external_attr = (inode.mode & 0xFFFF) << 16
+
+    if S_ISDIR(inode.mode):
+        info.external_attr |= 0x10
+
+    return info
+
+# Raw deflate stream (what zip stores), CRC32 and size of the uncompressed data
+def _deflate(data: bytes, level: int) -> tuple[bytes, int, int]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(), zlib.crc32(data), len(data)
+
+def _store(data: bytes, level: int) -> tuple[bytes, int, int]:
+    return data, zlib.crc32(data), len(data)
+
+# Compressed entry and, when there's a manifest to fill, the content hash (both done on the pool)
+def _pack(compress: Callable, data: bytes, level: int, digest: bool) -> tuple[tuple[bytes, int, int], str | None]:
+    return compress(data, level), new_hash(data).hexdigest() if digest else None
+
+# Passes reads through while hashing them, for data that's only read once
+class _HashingReader(RawIOBase):
+    def __init__(self, inp: RawIOBase) -> None:
+        self.hash = new_hash()
+        self.__fio: RawIOBase = inp
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, count: int=-1) -> bytes:
+        data = self.__fio.read(count)
+        self.hash.update(data)
+        return data
+
+# Everything below pathname, or only what changed since the previous manifest when there's one
+def _entries(fs: EFS2, pathname: str, manifest: Manifest | None, previous: Manifest | None) -> Iterator[EFS2Entry]:
+    if previous is None:
+        return fs.walk(pathname)
+
+    return select_changed(fs.walk(pathname), previous, manifest if manifest is not None else Manifest())
+
+# ZipFile has no public way to add data that was compressed elsewhere, _write_compressed uses these
+# internals (unchanged from 3.6 to 3.13) so compression can run on the pool while entries are still
+# written in order. Without them the pool only computes the CRC and hash, and zf.open(info, "w") compresses
+def _private_zip_api(zf: ZipFile) -> bool:
+    return all(hasattr(zf, a) for a in ("_lock", "_writecheck", "fp", "start_dir", "filelist", "NameToInfo")) and hasattr(ZipInfo, "FileHeader")
+
+# Same bookkeeping as ZipFile.open(info, "w") then close(), for data that's already compressed
+def _write_compressed(zf: ZipFile, info: ZipInfo, data: bytes, crc: int, size: int) -> None:
+    info.file_size = size
+    info.compress_size = len(data)
+    info.CRC = crc
+
+    with zf._lock:
+        zf._writecheck(info)
+        zf._didModify = True
+
+        info.header_offset = zf.fp.tell()
+        zf.fp.write(info.FileHeader(size > ZIP64_LIMIT or len(data) > ZIP64_LIMIT))
+        zf.fp.write(data)
+        zf.start_dir = zf.fp.tell()
+
+        zf.filelist.append(info)
+        zf.NameToInfo[info.filename] = info
+
+# With a manifest, every entry is recorded in it. With a previous manifest as well, only the entries
+# that changed since are written (the manifest still lists everything)
+def export_zip(fs: EFS2, out: str | RawIOBase, pathname: str="/", level: int=9, store: bool=False, jobs: int=0, progress: Callable[[str], None]=print, manifest: Manifest=None, previous: Manifest=None) -> int:
+    jobs = jobs if jobs > 0 else os.cpu_count()
+    digest = manifest is not None
+    errors = 0
+
+    # Files are read from the filesystem in order on this thread, compressed on the pool,
+    # and written back in the same order, with a bounded number of them in flight
+    pending: deque[tuple[EFS2Entry, ZipInfo, Future]] = deque()
+
+    def drain(limit: int) -> None:
+        nonlocal errors
+
+        while len(pending) > limit:
+            entry, info, future = pending.popleft()
+            name = entry.path
+
+            try:
+                packed, data_hash = future.result()
+
+                if private:
+                    _write_compressed(zf, info, *packed)
+
+                else:
+                    with zf.open(info, "w") as w:
+                        w.write(packed[0])
+
+                if manifest is not None:
+                    manifest.add(entry, hash_entry(entry) if entry.is_symlink() else data_hash)
+
+            except Exception as e:
+                traceback.print_exc()
+                print(f"error: {name}: {e}")
+                errors += 1
+
+    with ZipFile(out, "w", ZIP_STORED if store else ZIP_DEFLATED, compresslevel=None if store else level) as zf, ThreadPoolExecutor(jobs) as pool:
+        private = _private_zip_api(zf)
+        compress = _deflate if private and not store else _store
+
+        for entry in _entries(fs, pathname, manifest, previous):
+            name, inode = entry.path, entry.inode
+            if progress is not None:
+                progress(name)
+
+            try:
+                if S_ISDIR(inode.mode):
+                    info = _zip_info(name, inode, ZIP_STORED)
+                    pending.append((entry, info, pool.submit(_pack, _store, b"", level, False)))
+
+                elif S_ISLNK(inode.mode):
+                    # With the link mode in the attributes the data has to be the target, like in export_tar
+                    info = _zip_info(name, inode, ZIP_STORED)
+                    pending.append((entry, info, pool.submit(_pack, _store, inode.data, level, False)))
+
+                elif inode.file_size <= STREAM_THRESHOLD:
+                    info = _zip_info(name, inode, ZIP_STORED if store else ZIP_DEFLATED)
+                    pending.append((entry, info, pool.submit(_pack, compress, entry.open().read(), level, digest)))
+
+                else:
+                    # Big files skip the pool and go straight to the archive, after what's already queued
+                    drain(0)
+
+                    info = _zip_info(name, inode, ZIP_STORED if store else ZIP_DEFLATED)
+                    reader = entry.open() if manifest is None else _HashingReader(entry.open())
+
+                    with zf.open(info, "w", force_zip64=inode.file_size > ZIP64_LIMIT) as w:
+                        while len(temp := reader.read(EXPORT_BUFFER_SIZE)) > 0:
+                            w.write(temp)
+
+                    if manifest is not None:
+                        manifest.add(entry, reader.hash.hexdigest())
+
+            except Exception as e:
+                traceback.print_exc()
+                print(f"error: {e}")
+                errors += 1
+
+            drain(jobs * 4)
+
+        drain(0)
+
+    return errors
+
+def export_tar(fs: EFS2, out: str | RawIOBase, pathname: str="/", compression: str="", level: int=9, progress: Callable[[str], None]=print, manifest: Manifest=None, previous: Manifest=None) -> int:
+    errors = 0
+    kwargs = {} if compression == "" else {"preset": level} if compression == "xz" else {"compresslevel": level}
+
+    with tarfile.open(out if type(out) == str else None, f"w:{compression}", None if type(out) == str else out, **kwargs) as tf:
+        tf.copybufsize = EXPORT_BUFFER_SIZE
+
+        for entry in _entries(fs, pathname, manifest, previous):
+            name, inode = entry.path, entry.inode
+            if progress is not None:
+                progress(name)
+
+            try:
+                data_hash = None
+                info = tarfile.TarInfo(name.strip("/"))
+                info.mode = S_IMODE(inode.mode)
+                info.mtime = max(0, int(inode.modified_time.timestamp()))
+                info.gid = inode.group_id
+
+                if S_ISDIR(inode.mode):
+                    info.type = tarfile.DIRTYPE
+                    tf.addfile(info)
+
+                elif S_ISLNK(inode.mode):
+                    info.type = tarfile.SYMTYPE
+                    info.linkname = inode.data.decode(fs.encoding)
+                    tf.addfile(info)
+
+                    data_hash = hash_entry(entry)
+
+                else:
+                    # tarfile copies from the reader through copybufsize sized reads
+                    info.size = inode.file_size
+                    reader = entry.open() if manifest is None else _HashingReader(entry.open())
+                    tf.addfile(info, reader)
+
+                    if manifest is not None:
+                        data_hash = reader.hash.hexdigest()
+
+                if manifest is not None:
+                    manifest.add(entry, data_hash)
+
+            except Exception as e:
+                traceback.print_exc()
+                print(f"error: {e}")
+                errors += 1
+
+    return errors
+
+# Bodies go to the object store, and the tree of the image to its manifest there. Files whose inode
+# didn't change since the last export of the same image aren't read at all
+def export_store(fs: EFS2, store: str | ObjectStore, name: str, pathname: str="/", level: int=6, progress: Callable[[str], None]=print) -> int:
+    owned = type(store) == str
+    store = ObjectStore(store, level) if owned else store
+    errors = 0
+
+    try:
+        previous = store.load_tree(name)
+        manifest = Manifest()
+
+        for entry in _entries(fs, pathname, manifest, previous):
+            if progress is not None:
+                progress(entry.path)
+
+            try:
+                if entry.is_dir():
+                    manifest.add(entry, None)
+
+                elif entry.is_symlink():
+                    manifest.add(entry, store.put(entry.inode.data))
+
+                else:
+                    manifest.add(entry, store.put_entry(entry))
+
+            except Exception as e:
+                traceback.print_exc()
+                print(f"error: {e}")
+                errors += 1
+
+        store.save_tree(name, manifest)
+
+    finally:
+        # Flushes the pre-hash index, a store that was passed in is left to its owner
+        if owned:
+            store.close()
+
+    return errors
@@ -116,6 +116,33 @@ class INode():
         self.pm = pm
         self.table_count = pm.super.page_size // 4
 
+    # Cluster of every page of the file, in file order
+    def clusters(self) -> list[int]:
+        temp = [x for x in self.direct_clusters]
+
+        def recurse(depth, cluster):
+            self.pm.forward_seek(cluster)
+            table = [by2int(self.pm.file.read(4)) for _ in range(self.table_count)]
+
+            if depth <= 0:
+                return table
+
+            else:
+                temp = []
+                for c in table:
+                    if c == 0xffffffff: break
+                    temp.extend(recurse(depth - 1, c))
+
+                return temp
+
+        for depth, cluster in enumerate(self.indirect_clusters):
+            if cluster == 0xffffffff: # Terminate when null cluster is found
+                break
+
+            temp.extend(recurse(depth, cluster))
+
+        return temp
+
     def __repr__(self) -> str:
         return "<{klass} {attrs}>".format(
             klass=self.__class__.__name__,
@@ -144,29 +171,7 @@ class INodeReader(RawIOBase):
         self.__closed = False
 
         # 02 - Setup Tables
-        self.__inode_tables = [x for x in inode.direct_clusters]
-
-        for depth, cluster in enumerate(inode.indirect_clusters):
-            if cluster == 0xffffffff: # Terminate when null cluster is found
-                break
-
-            def recurse(depth, cluster):
-                inode.pm.forward_seek(cluster)
-                table = [by2int(inode.pm.file.read(4)) for _ in range(inode.table_count)]
-
-                if depth <= 0:
-                    return table
-
-                else:
-                    temp = []
-                    for c in table:
-                        if c == 0xffffffff: break
-                        temp.extend(recurse(depth - 1, c))
-
-                    return temp
-
-            self.__inode_tables.extend(recurse(depth, cluster))
-
+        self.__inode_tables = inode.clusters()
         self.__inode = inode
 
     def read(self, count=-1) -> bytes:
@@ -177,10 +182,10 @@ class INodeReader(RawIOBase):
             return b""
 
         # 04 - Loop until count is zero
-        read_count = (self.__inode.file_size - self.__offset) if count == -1 else count
+        read_count = (self.__inode.file_size - self.__offset) if count == -1 else min(count, self.__inode.file_size - self.__offset)
 
         while read_count:
-            self.__inode.pm.forward_seek(self.__inode_tables[self.__offset // self.__inode.pm.super.page_size])
+            self.__inode.pm.forward_seek(self.__inode_tables[self.__offset // self.__inode.pm.super.page_size], self.__offset % self.__inode.pm.super.page_size)
             t_read_count = min(self.__inode.pm.super.page_size - (self.__offset % self.__inode.pm.super.page_size), read_count)
 
             temp += self.__inode.pm.file.read(t_read_count)
@@ -3,6 +3,8 @@ from .super import Superblock
 from io import RawIOBase
 from enum import IntEnum
 from .utils import ilog2, by2int, EFS_CRC
+from array import array
+from bisect import bisect_left
 
 class UpdateTableType(IntEnum):
     PTABLE_INDEX = 0
@@ -39,6 +41,34 @@ class PageLog(metaclass=ABCMeta):
             attrs=" ".join("{}={!r}".format(k, v) for k, v in self.__dict__.items()),
         )
 
+# Log overrides frozen into sorted index/value arrays once the log is parsed,
+# with a presence bitmap in front so the common case (no override) skips the search
+class OverrideTable():
+    def __init__(self, overrides: dict[int, int]) -> None:
+        keys = sorted(overrides)
+
+        self.__keys: array = array('I', keys)
+        self.__values: array = array('I', [overrides[k] for k in keys])
+        self.__present: bytearray = bytearray(((keys[-1] >> 3) + 1) if len(keys) > 0 else 0)
+
+        for k in keys:
+            self.__present[k >> 3] |= 1 << (k & 7)
+
+    def get(self, index: int, fallback_value: int=-1) -> int:
+        if (index >> 3) >= len(self.__present) or not self.__present[index >> 3] & (1 << (index & 7)):
+            return fallback_value
+
+        return self.__values[bisect_left(self.__keys, index)]
+
+    def __contains__(self, index: int) -> bool:
+        return (index >> 3) < len(self.__present) and bool(self.__present[index >> 3] & (1 << (index & 7)))
+
+    def __len__(self) -> int:
+        return len(self.__keys)
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} entries={len(self.__keys)}>"
+
 class TableUpdateEvent():
     def __init__(self, type: UpdateTableType, level: int, index: int, value: int):
         self.type = type
@@ -0,0 +1,147 @@
+from .efs2 import EFS2Entry
+from .inode import InlineINode
+from stat import S_ISREG, S_ISDIR
+from typing import Iterable, Iterator
+import hashlib
+import json
+
+__all__ = [
+    'Manifest',
+    'hash_entry',
+    'hash_file',
+    'select_changed'
+]
+
+# Content hash of the file bodies, also the key of the object store
+MANIFEST_HASH = "sha256"
+HASH_BUFFER_SIZE = 0x10000
+
+def new_hash(data: bytes=b"") -> "hashlib._Hash":
+    return hashlib.new(MANIFEST_HASH, data)
+
+# Hash of the file contents (or of the target of a symlink), None for directories
+def hash_entry(entry: EFS2Entry) -> str | None:
+    if entry.is_symlink():
+        return new_hash(entry.inode.data).hexdigest()
+
+    if not S_ISREG(entry.inode.mode):
+        return None
+
+    temp = new_hash()
+    reader = entry.open()
+
+    while len(data := reader.read(HASH_BUFFER_SIZE)) > 0:
+        temp.update(data)
+
+    return temp.hexdigest()
+
+def hash_file(filename: str) -> str:
+    temp = new_hash()
+
+    with open(filename, "rb") as f:
+        while len(data := f.read(HASH_BUFFER_SIZE)) > 0:
+            temp.update(data)
+
+    return temp.hexdigest()
+
+# What was exported from an image, one JSON object per line:
+# path, inode id, generation, size, mtime and content hash of every entry
+class Manifest():
+    def __init__(self) -> None:
+        self.records: dict[str, dict] = {}
+
+    @classmethod
+    def load(cls, filename: str) -> "Manifest":
+        temp = cls()
+
+        with open(filename, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip() != "":
+                    record = json.loads(line)
+                    temp.records[record["path"]] = record
+
+        return temp
+
+    def save(self, filename: str) -> None:
+        with open(filename, "w", encoding="utf-8", newline="\n") as f:
+            for record in self.records.values():
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def add(self, entry: EFS2Entry, digest: str | None) -> dict:
+        inode = entry.inode
+
+        self.records[entry.path] = {
+            "path": entry.path,
+            "mode": inode.mode,
+            "inode": getattr(inode, "id", None), # Inline files don't have an inode of their own
+            "generation": inode.generation,
+            "size": inode.file_size,
+            "mtime": int(inode.modified_time.timestamp()),
+            "hash": digest,
+        }
+
+        return self.records[entry.path]
+
+    def get(self, path: str) -> dict | None:
+        return self.records.get(path, None)
+
+    # The recorded entry when the inode metadata says the file hasn't been touched since
+    def unchanged(self, entry: EFS2Entry) -> dict | None:
+        record = self.records.get(entry.path, None)
+        inode = entry.inode
+
+        if record is None or (record["hash"] is None and S_ISREG(inode.mode)):
+            return None
+
+        # Inline files and symlinks have no inode id, a fixed generation and often no mtime, so the metadata
+        # says nothing about them. Their data is already in memory, compare that instead
+        if isinstance(inode, InlineINode) and not S_ISDIR(inode.mode):
+            return record if record["mode"] == inode.mode and record["hash"] == new_hash(inode.data).hexdigest() else None
+
+        if record["mode"] != inode.mode or record["inode"] != getattr(inode, "id", None) or record["generation"] != inode.generation:
+            return None
+
+        if record["size"] != inode.file_size or record["mtime"] != int(inode.modified_time.timestamp()):
+            return None
+
+        return record
+
+    def removed(self, newer: "Manifest") -> list[str]:
+        return [path for path in self.records if path not in newer.records]
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.records
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __repr__(self) -> str:
+        return "<{klass} entries={count}>".format(
+            klass=self.__class__.__name__,
+            count=len(self.records),
+        )
+
+# Entries that differ from the previous manifest. Skipped ones are recorded in manifest right away,
+# the caller records the rest once it has read them (and so has their hash)
+def select_changed(entries: Iterable[EFS2Entry], previous: Manifest | None, manifest: Manifest) -> Iterator[EFS2Entry]:
+    for entry in entries:
+        if previous is None:
+            yield entry
+            continue
+
+        # 01 - Same inode, generation, size and mtime, take the old hash without reading anything
+        record = previous.unchanged(entry)
+        if record is not None:
+            manifest.records[entry.path] = dict(record)
+            continue
+
+        # 02 - Metadata changed but the size didn't, the contents may still be the same
+        record = previous.get(entry.path)
+        if record is not None and record["size"] == entry.inode.file_size and record["mode"] == entry.inode.mode:
+            digest = hash_entry(entry)
+
+            if digest == record["hash"]:
+                manifest.add(entry, digest)
+                continue
+
+        yield entry
@@ -1,4 +1,7 @@
 from construct import Struct, Const, Hex, Int32ul, this, Bytes, PaddedString, Array, Padding
+from io import RawIOBase, UnsupportedOperation
+import mmap
+import os
 
 PARTITION_TABLE = Struct(
     "magic1" / Const(b"\xAA\x73\xEE\x55"),
@@ -32,10 +35,17 @@ class Partition():
             attrs=" ".join("{}={!r}".format(k, v) for k, v in self.__dict__.items() if k != "pm"),
         )
 
+PARTITION_MAGIC = b"\xAA\x73\xEE\x55\xDB\xBD\x5E\xE3"
+
+# The table lives in the second page of its block, page size -> erase block size
+PARTITION_BLOCK_SIZES = {0x200: 0x4000, 0x800: 0x20000, 0x1000: 0x40000}
+
 class PartitionTable():
     def __init__(self, data: bytes, block_size: int=0x20000):
         ptable = PARTITION_TABLE.parse(data)
 
+        self.offset: int = -1
+        self.block_size: int = block_size
         self.version: int = ptable.p_ver
         self.partitions: list[Partition] = []
 
@@ -54,4 +64,101 @@ class PartitionTable():
         return "<{klass} {attrs}>".format(
             klass=self.__class__.__name__,
             attrs=" ".join("{}={!r}".format(k, v) for k, v in self.__dict__.items() if k != "pm"),
-        )
\ No newline at end of file
+        )
+
+# Located tables, keyed by the identity of the image file and the requested block size
+_TABLES: dict[tuple, PartitionTable] = {}
+
+def _candidates(file: RawIOBase):
+    try:
+        fd = file.fileno()
+        m = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+
+    except (AttributeError, OSError, UnsupportedOperation, ValueError):
+        m = None
+
+    if m is not None:
+        with m:
+            pos = m.find(PARTITION_MAGIC)
+
+            while pos != -1:
+                if pos % 0x200 == 0:
+                    yield pos, m[pos:pos + 0x1000]
+
+                pos = m.find(PARTITION_MAGIC, pos + 1)
+
+        return
+
+    # Not a plain file (ECC or bad block wrapper...), walk it in chunks overlapping by the magic size
+    offset = 0
+    chunk_size = 0x100000
+
+    while True:
+        file.seek(offset)
+        chunk = file.read(chunk_size + len(PARTITION_MAGIC) - 1)
+        if len(chunk) < len(PARTITION_MAGIC):
+            break
+
+        pos = chunk.find(PARTITION_MAGIC)
+        while pos != -1:
+            if (offset + pos) % 0x200 == 0:
+                file.seek(offset + pos)
+                yield offset + pos, file.read(0x1000)
+
+            pos = chunk.find(PARTITION_MAGIC, pos + 1)
+
+        offset += chunk_size
+
+def _block_sizes(offset: int, block_size: int | None) -> list[int]:
+    if block_size is not None:
+        return [block_size] if offset % block_size in PARTITION_BLOCK_SIZES else []
+
+    return [b for p, b in PARTITION_BLOCK_SIZES.items() if offset % b == p]
+
+def find_partition_table(file: RawIOBase | str, block_size: int=None) -> PartitionTable:
+    if type(file) == str:
+        with open(file, "rb") as f:
+            return find_partition_table(f, block_size)
+
+    try:
+        st = os.fstat(file.fileno())
+        key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, block_size)
+
+    except (AttributeError, OSError, UnsupportedOperation, ValueError):
+        key = None
+
+    if key is not None and key in _TABLES:
+        return _TABLES[key]
+
+    fallback = None
+
+    for offset, data in _candidates(file):
+        for size in _block_sizes(offset, block_size):
+            try:
+                temp = PartitionTable(data, size)
+
+            except Exception:
+                continue
+
+            if temp.version == 0 or len(temp.partitions) <= 0 or len(temp.partitions) > 0x40:
+                continue
+
+            temp.offset = offset
+
+            # A table with the right block size has a partition covering itself
+            if any(p.start <= offset and (p.end == -1 or offset < p.end) for p in temp.partitions):
+                if key is not None:
+                    _TABLES[key] = temp
+
+                return temp
+
+            if fallback is None:
+                fallback = temp
+
+    if fallback is None:
+        raise Exception("Could not find partition table")
+
+    if key is not None:
+        _TABLES[key] = fallback
+
+    return fallback
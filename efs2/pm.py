@@ -26,8 +26,11 @@ class PageManager(metaclass=ABCMeta):
         if temp == 0xffffffff: print("WARN: invalid cluster")
         return temp * self.super.page_size
 
+    def forward_file_offset(self, cluster: int) -> int:
+        return self._base_offset + self.forward_to_offset(cluster)
+
     def forward_seek(self, cluster: int, offset_from_cluster: int=0) -> None:
-        self.file.seek(self._base_offset + self.forward_to_offset(cluster) + (offset_from_cluster % self.super.page_size))
+        self.file.seek(self.forward_file_offset(cluster) + (offset_from_cluster % self.super.page_size))
 
     def set_log(self, log: PageLog):
         self._log = log
@@ -1,5 +1,5 @@
 from .pm import PageManager
-from .log import PageLog, DoParseLog, UpdateTableType
+from .log import PageLog, DoParseLog, UpdateTableType, OverrideTable
 from .super import Superblock, Regions
 from io import RawIOBase
 from .log import PageLog
@@ -86,20 +86,27 @@ class NANDLog(PageLog):
             if log_index >= log_lowermost:
                 log_index = log_uppermost
 
+        # 04 - Freeze overrides, they're only looked up from now on
+        self.__override_ptable_index = OverrideTable(self.__override_ptable_index)
+        self.__override_rtable_index = OverrideTable(self.__override_rtable_index)
+
+        self.__override_ptable_level = {level: OverrideTable(nodes) for level, nodes in self.__override_ptable_level.items()}
+        self.__override_rtable_level = {level: OverrideTable(nodes) for level, nodes in self.__override_rtable_level.items()}
+
     def get_upper_data(self) -> list[int]:
         return self.__override_upper
 
     def get_ptable_index(self, index: int, fallback_value: int=-1) -> int:
-        return self.__override_ptable_index[index] if index in self.__override_ptable_index else fallback_value
+        return self.__override_ptable_index.get(index, fallback_value)
 
     def get_rtable_index(self, index: int, fallback_value: int=-1) -> int:
-        return self.__override_rtable_index[index] if index in self.__override_rtable_index else fallback_value
+        return self.__override_rtable_index.get(index, fallback_value)
 
     def get_ptable_node(self, level: int, index: int, fallback_value: int=-1) -> int:
-        return self.__override_ptable_level[level][index] if level in self.__override_ptable_level and index in self.__override_ptable_level[level] else fallback_value
+        return self.__override_ptable_level[level].get(index, fallback_value) if level in self.__override_ptable_level else fallback_value
 
     def get_rtable_node(self, level: int, index: int, fallback_value: int=-1) -> int:
-        return self.__override_rtable_level[level][index] if level in self.__override_rtable_level and index in self.__override_rtable_level[level] else fallback_value
+        return self.__override_rtable_level[level].get(index, fallback_value) if level in self.__override_rtable_level else fallback_value
 
 class NANDPM(PageManager):
     def __recurse_nodes(self, curNode: int, depth: int, nodenum: int, table_type: int) -> int:
@@ -124,8 +131,9 @@ class NANDPM(PageManager):
             return node
 
     def get_forward(self, cluster: int) -> int:
-        if self._log is not None and self._log.get_ptable_index(cluster) != -1:
-            return self._log.get_ptable_index(cluster)
+        temp = self._log.get_ptable_index(cluster) if self._log is not None else -1
+        if temp != -1:
+            return temp
 
         if self.super.page_depth == 1:
             failover = self.super.ptables[cluster]
@@ -139,8 +147,8 @@ class NANDPM(PageManager):
             return self.__recurse_nodes(start, self.super.page_depth - 2, cluster, 0)
 
     def get_reverse(self, page: int) -> int:
-        if self._log is not None and self._log.get_rtable_index(page) != -1:
-            temp = self._log.get_rtable_index(page)
+        temp = self._log.get_rtable_index(page) if self._log is not None else -1
+        if temp != -1:
             if (temp >> 31) == 0:
                 temp &= 0xffffff
 
@@ -3,6 +3,7 @@ from .super import Superblock
 from io import RawIOBase
 from .utils import by2int
 from .log import PageLog, DoVerifyLog, DoParseLog, UpdateTableType
+from array import array
 
 class NORLog(PageLog):
     def __init__(self, sb: Superblock, file: RawIOBase, base_offset: int, pm: PageManager) -> None:
@@ -156,7 +157,7 @@ class NORPM(PageManager):
             self.__major_shift += 1
 
         self.__reserved_offset = sb.block_size - ((sb.block_size + self.__minor_mask) >> self.__major_shift)
-        self.__ptables = [0xffffffff] * sb.page_total
+        self.__ptables: array = array('I', b"\xff" * (sb.page_total * 4))
 
     @staticmethod
     def __get_paired_bits(paired: int):
@@ -177,9 +178,8 @@ class NORPM(PageManager):
         return self.__ptables[cluster]
 
     def get_reverse(self, page: int):
-        if self._log is not None and self._log.get_rtable_index(page) != -1:
-            temp = self._log.get_rtable_index(page)
-
+        temp = self._log.get_rtable_index(page) if self._log is not None else -1
+        if temp != -1:
             if temp == 0:
                 return 0xfffffff4
 
@@ -0,0 +1,208 @@
+from io import RawIOBase, SEEK_SET
+from bisect import bisect_right
+import os
+
+__all__ = [
+    'SparseWriter',
+    'SparseFile',
+    'write_sparse',
+    'fill_holes'
+]
+
+# Holes always stand for erased flash, a hole can only be read back as one value
+SPARSE_FILL = 0xff
+
+def _pwrite(fd: int, data: bytes, offset: int) -> None:
+    if hasattr(os, "pwrite"):
+        os.pwrite(fd, data, offset)
+
+    else:
+        os.lseek(fd, offset, os.SEEK_SET)
+        os.write(fd, data)
+
+def _is_hole(fd: int, start: int, end: int) -> bool:
+    if not hasattr(os, "SEEK_DATA"):
+        return False
+
+    try:
+        return os.lseek(fd, start, os.SEEK_DATA) >= end
+
+    except OSError:
+        # ENXIO, nothing but a hole up to the end of the file
+        return True
+
+def _holes(fd: int) -> list[tuple[int, int]]:
+    temp = []
+    if not hasattr(os, "SEEK_HOLE"):
+        return temp
+
+    size = os.fstat(fd).st_size
+    offset = 0
+
+    while offset < size:
+        try:
+            start = os.lseek(fd, offset, os.SEEK_HOLE)
+
+        except OSError:
+            break
+
+        # There's always an implicit hole at the end of the file
+        if start >= size:
+            break
+
+        try:
+            end = os.lseek(fd, start, os.SEEK_DATA)
+
+        except OSError:
+            end = size
+
+        temp.append((start, end))
+        offset = end
+
+    return temp
+
+# pwrite() that skips aligned blocks of erased data, returns the skipped ranges
+def write_sparse(fd: int, data: bytes, offset: int, block_size: int=0x20000) -> list[tuple[int, int]]:
+    temp = []
+    erased = bytes([SPARSE_FILL]) * block_size
+    data = memoryview(data)
+
+    pos = 0
+    run_start = 0
+
+    while pos < len(data):
+        # Only whole blocks aligned in the output can become holes
+        size = min(block_size - ((offset + pos) % block_size), len(data) - pos)
+
+        if size == block_size and data[pos:pos + size] == erased:
+            if run_start < pos:
+                _pwrite(fd, data[run_start:pos], offset + run_start)
+
+            if len(temp) > 0 and temp[-1][1] == offset + pos:
+                temp[-1] = (temp[-1][0], offset + pos + size)
+
+            else:
+                temp.append((offset + pos, offset + pos + size))
+
+            run_start = pos + size
+
+        pos += size
+
+    if run_start < len(data):
+        _pwrite(fd, data[run_start:], offset + run_start)
+
+    return temp
+
+# Writes out the skipped ranges that the filesystem didn't keep as holes, returns the bytes saved
+def fill_holes(fd: int, ranges: list[tuple[int, int]], block_size: int=0x20000) -> int:
+    saved = 0
+    erased = bytes([SPARSE_FILL]) * block_size
+
+    for start, end in ranges:
+        if _is_hole(fd, start, end):
+            saved += end - start
+            continue
+
+        for offset in range(start, end, block_size):
+            _pwrite(fd, erased[:min(block_size, end - offset)], offset)
+
+    return saved
+
+# Sequential output file with the erased blocks left out
+class SparseWriter(RawIOBase):
+    def __init__(self, filename: str, block_size: int=0x20000) -> None:
+        self.block_size: int = block_size
+        self.saved: int = 0
+
+        self.__fd: int = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o666)
+        self.__offset: int = 0
+        self.__pending: bytearray = bytearray()
+        self.__holes: list[tuple[int, int]] = []
+        self.__closed: bool = False
+
+    def writable(self) -> bool:
+        return True
+
+    def __flush(self, count: int) -> None:
+        self.__holes += write_sparse(self.__fd, self.__pending[:count], self.__offset, self.block_size)
+        self.__offset += count
+        del self.__pending[:count]
+
+    def write(self, data: bytes) -> int:
+        self.__pending += data
+
+        # Keep the writes aligned to the block size
+        count = len(self.__pending) - ((self.__offset + len(self.__pending)) % self.block_size)
+        if count > 0:
+            self.__flush(count)
+
+        return len(data)
+
+    def tell(self) -> int:
+        return self.__offset + len(self.__pending)
+
+    def close(self) -> None:
+        if not self.__closed:
+            self.__flush(len(self.__pending))
+
+            # Trailing holes don't extend the file by themselves
+            os.ftruncate(self.__fd, self.__offset)
+            self.saved = fill_holes(self.__fd, self.__holes, self.block_size)
+
+            os.close(self.__fd)
+            self.__closed = True
+
+    def __del__(self) -> None:
+        self.close()
+
+# Reader for the output of SparseWriter, holes are read back as erased data
+class SparseFile(RawIOBase):
+    def __init__(self, inp: str | RawIOBase) -> None:
+        self.__fio: RawIOBase = open(inp, "rb") if type(inp) == str else inp
+        self.__closed: bool = False
+
+        self.holes: list[tuple[int, int]] = _holes(self.__fio.fileno())
+        self.__hole_starts: list[int] = [s for s, _ in self.holes]
+
+        self.__fio.seek(0)
+
+    def seek(self, to: int, where: int=SEEK_SET) -> int:
+        return self.__fio.seek(to, where)
+
+    def tell(self) -> int:
+        return self.__fio.tell()
+
+    def read(self, count: int=-1) -> bytes:
+        if self.__closed:
+            return b""
+
+        offset = self.__fio.tell()
+        data = self.__fio.read(count)
+
+        end = offset + len(data)
+        index = max(0, bisect_right(self.__hole_starts, offset) - 1)
+
+        temp = None
+        for start, stop in self.holes[index:]:
+            if start >= end:
+                break
+
+            if stop <= offset:
+                continue
+
+            if temp is None:
+                temp = bytearray(data)
+
+            start = max(start, offset)
+            stop = min(stop, end)
+            temp[start - offset:stop - offset] = bytes([SPARSE_FILL]) * (stop - start)
+
+        return data if temp is None else bytes(temp)
+
+    def close(self) -> None:
+        if not self.__closed:
+            self.__fio.close()
+            self.__closed = True
+
+    def __del__(self) -> None:
+        self.close()
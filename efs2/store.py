@@ -0,0 +1,141 @@
+from .efs2 import EFS2Entry
+from .manifest import Manifest, MANIFEST_HASH, new_hash
+import hashlib
+import zlib
+import os
+
+__all__ = [
+    'ObjectStore'
+]
+
+# Only the size and the start of a file go into the pre-hash, reading that much is nearly free
+PREHASH_SIZE = 0x1000
+STORE_BUFFER_SIZE = 0x10000
+
+def _prehash(size: int, head: bytes) -> str:
+    return hashlib.blake2b(size.to_bytes(8, "little") + head, digest_size=16).hexdigest()
+
+# File bodies shared by many images, stored once under objects/ by content hash (zlib compressed),
+# with the tree of every image in trees/<name>.ndjson as a manifest pointing at them
+class ObjectStore():
+    def __init__(self, root: str, level: int=6) -> None:
+        self.root: str = root
+        self.level: int = level
+
+        # Pre-hash to content hashes seen with it, so a body that's certainly new can be
+        # hashed and compressed in one pass, and one that's probably stored isn't compressed at all
+        self.__prehashes: dict[str, set[str]] = {}
+        self.__index_path: str = os.path.join(root, "prehash.idx")
+
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(root, "trees"), exist_ok=True)
+
+        if os.path.exists(self.__index_path):
+            with open(self.__index_path, "r") as f:
+                for line in f:
+                    if len(parts := line.split()) == 2:
+                        self.__prehashes.setdefault(parts[0], set()).add(parts[1])
+
+        self.__index = open(self.__index_path, "a")
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, "objects", digest[:2], digest)
+
+    def __contains__(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+    def __remember(self, pre: str, digest: str) -> None:
+        if digest not in self.__prehashes.setdefault(pre, set()):
+            self.__prehashes[pre].add(digest)
+            self.__index.write(f"{pre} {digest}\n")
+
+    # Compresses the chunks into a temporary file and returns the content hash,
+    # the object is only moved in place once it's complete
+    def __write(self, chunks) -> str:
+        temp = new_hash()
+        compressor = zlib.compressobj(self.level)
+        temp_path = os.path.join(self.root, "objects", f".tmp-{os.getpid()}-{id(compressor):x}")
+
+        with open(temp_path, "wb") as f:
+            for data in chunks:
+                temp.update(data)
+                f.write(compressor.compress(data))
+
+            f.write(compressor.flush())
+
+        digest = temp.hexdigest()
+
+        os.makedirs(os.path.dirname(self.path(digest)), exist_ok=True)
+        os.replace(temp_path, self.path(digest))
+
+        return digest
+
+    def put(self, data: bytes) -> str:
+        digest = new_hash(data).hexdigest()
+
+        if digest not in self:
+            self.__write([data])
+
+        self.__remember(_prehash(len(data), data[:PREHASH_SIZE]), digest)
+        return digest
+
+    def put_entry(self, entry: EFS2Entry) -> str:
+        reader = entry.open()
+        head = reader.read(PREHASH_SIZE)
+        pre = _prehash(entry.inode.file_size, head)
+
+        def chunks(reader, head):
+            yield head
+            while len(data := reader.read(STORE_BUFFER_SIZE)) > 0:
+                yield data
+
+        if pre not in self.__prehashes:
+            # 01 - Nothing stored starts like this, it's new: hash and compress in one pass
+            digest = self.__write(chunks(reader, head))
+
+        else:
+            # 02 - Probably stored already, hash it and only compress it when it turns out not to be
+            temp = new_hash()
+            for data in chunks(reader, head):
+                temp.update(data)
+
+            digest = temp.hexdigest()
+
+            if digest not in self:
+                reader = entry.open()
+                self.__write(chunks(reader, reader.read(PREHASH_SIZE)))
+
+        self.__remember(pre, digest)
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        with open(self.path(digest), "rb") as f:
+            return zlib.decompress(f.read())
+
+    def tree_path(self, name: str) -> str:
+        return os.path.join(self.root, "trees", name + ".ndjson")
+
+    def load_tree(self, name: str) -> Manifest | None:
+        return Manifest.load(self.tree_path(name)) if os.path.exists(self.tree_path(name)) else None
+
+    def save_tree(self, name: str, manifest: Manifest) -> None:
+        manifest.save(self.tree_path(name) + ".tmp")
+        os.replace(self.tree_path(name) + ".tmp", self.tree_path(name))
+
+    def trees(self) -> list[str]:
+        return sorted(f[:-len(".ndjson")] for f in os.listdir(os.path.join(self.root, "trees")) if f.endswith(".ndjson"))
+
+    def close(self) -> None:
+        if not self.__index.closed:
+            self.__index.close()
+
+    def __del__(self) -> None:
+        self.close()
+
+    def __repr__(self) -> str:
+        return "<{klass} root={root!r} hash={hash} trees={trees}>".format(
+            klass=self.__class__.__name__,
+            root=self.root,
+            hash=MANIFEST_HASH,
+            trees=len(self.trees()),
+        )
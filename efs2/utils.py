@@ -1,5 +1,7 @@
 from crcmod import mkCrcFun
 from math import log2
+from io import RawIOBase, UnsupportedOperation
+import os
 
 EFS_CRC = mkCrcFun(0x11021, initCrc=0, xorOut=0xffff)
 
@@ -13,4 +15,94 @@ def by2int(x):
     return int.from_bytes(x, "little")
 
 def by2int_s(x):
-    return int.from_bytes(x, "little", signed=True)
\ No newline at end of file
+    return int.from_bytes(x, "little", signed=True)
+
+COPY_CHUNK_SIZE = 0x100000
+
+def _kernel_copiers() -> list:
+    temp = []
+
+    if hasattr(os, "copy_file_range"):
+        temp.append(lambda in_fd, out_fd, offset, count: os.copy_file_range(in_fd, out_fd, count, offset))
+
+    if hasattr(os, "sendfile"):
+        temp.append(lambda in_fd, out_fd, offset, count: os.sendfile(out_fd, in_fd, offset, count))
+
+    return temp
+
+# Copies count bytes (-1 = up to the end) from offset in in_file to the current position of out_file,
+# in the kernel when both are real files, otherwise through a fixed size buffer
+def copy_range(in_file: RawIOBase, out_file: RawIOBase, offset: int, count: int=-1) -> int:
+    if count < 0:
+        in_file.seek(0, os.SEEK_END)
+        count = max(0, in_file.tell() - offset)
+
+    copied = 0
+
+    try:
+        in_fd, out_fd = in_file.fileno(), out_file.fileno()
+
+    except (AttributeError, OSError, UnsupportedOperation):
+        in_fd = out_fd = None
+
+    if in_fd is not None:
+        out_file.flush()
+
+        for kernel_copy in _kernel_copiers():
+            try:
+                while copied < count:
+                    done = kernel_copy(in_fd, out_fd, offset + copied, min(COPY_CHUNK_SIZE * 64, count - copied))
+                    if done <= 0:
+                        break
+
+                    copied += done
+
+                break
+
+            except OSError:
+                # Not possible between these two files (cross-device, special files, old kernel...)
+                if copied > 0:
+                    break
+
+        # Both advance the descriptor behind the file object's back
+        out_file.seek(os.lseek(out_fd, 0, os.SEEK_CUR))
+
+    in_file.seek(offset + copied)
+    while copied < count:
+        temp = in_file.read(min(COPY_CHUNK_SIZE, count - copied))
+        if len(temp) <= 0:
+            break
+
+        out_file.write(temp)
+        copied += len(temp)
+
+    return copied
+
+# Copies count bytes between two descriptors at explicit offsets, without touching either file position
+def copy_range_at(in_fd: int, out_fd: int, in_offset: int, out_offset: int, count: int) -> int:
+    copied = 0
+
+    if hasattr(os, "copy_file_range"):
+        try:
+            while copied < count:
+                done = os.copy_file_range(in_fd, out_fd, count - copied, in_offset + copied, out_offset + copied)
+                if done <= 0:
+                    return copied
+
+                copied += done
+
+            return copied
+
+        except OSError:
+            # Not possible between these two files, finish with plain positioned I/O
+            pass
+
+    while copied < count:
+        temp = os.pread(in_fd, min(COPY_CHUNK_SIZE, count - copied), in_offset + copied)
+        if len(temp) <= 0:
+            break
+
+        os.pwrite(out_fd, temp, out_offset + copied)
+        copied += len(temp)
+
+    return copied
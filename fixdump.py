@@ -1,7 +1,46 @@
 from efs2 import *
+import os
+
+_nand: ECCFile = None
+
+def _init_worker(in_filename: str, ecc_args: tuple, instrument: bool, cache: str, spare_file: str) -> None:
+    global _nand
+    _nand = ECCFile(in_filename, *ecc_args, instrument=instrument, cache=cache, spare_file=spare_file)
+
+def _fix_range(out_filename: str, start: int, end: int, sparse: bool=False) -> tuple[ECCStats | None, list[tuple[int, int]]]:
+    fd = os.open(out_filename, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+    holes = []
+
+    try:
+        _nand.seek(start)
+        offset = start
+
+        while offset < end:
+            temp = _nand.read(end - offset if sparse else min(0x10000, end - offset))
+            if temp == b"":
+                break
+
+            if sparse:
+                # The output is pre-truncated, so skipped blocks are already holes
+                holes += write_sparse(fd, temp, offset, end - start)
+
+            elif hasattr(os, "pwrite"):
+                os.pwrite(fd, temp, offset)
+
+            else:
+                os.lseek(fd, offset, os.SEEK_SET)
+                os.write(fd, temp)
+
+            offset += len(temp)
+
+    finally:
+        os.close(fd)
+
+    return _nand.stats.section(start // 0x200, -(-offset // 0x200)) if _nand.stats is not None else None, holes
 
 if __name__ == "__main__":
     import argparse
+    from concurrent.futures import ProcessPoolExecutor
 
     def intorhex(d):
         try:
@@ -15,23 +54,77 @@ if __name__ == "__main__":
     ap.add_argument("out_filename", help="Destination file")
     ap.add_argument("spare_offset", nargs="?", type=intorhex, help="Offset to spare (RIFF) or Page size (standard), use 0x prefix to parse as hexadecimal")
     ap.add_argument("-s", "--spare-type", choices=["riff", "standard", "qcom", "separate"], default="riff", help="Specify which NAND format to parse: (riff = RIFF Box/Spare at end, standard = Data/Spare interleaved, qcom = QCOM NANDC 2k format, separate = separate Data/NAND)")
+    ap.add_argument("-sf", "--spare-file", help="Spare (OOB) file when using the separate spare type")
     ap.add_argument("-b", "--bbm", type=intorhex, default=5, help="Bad blocks offset (ineffective on QCOM nandc mode)")
     ap.add_argument("-w", "--width", choices=[8, 16], default=16, type=int, help="Page width")
     ap.add_argument("-e", "--ecc-algo", choices=["rs", "hamming20", "hamming20_bitpack"], default="rs", help="Error correction algorithm (rs = Reed-Solomon, hamming20 = Qualcomm 20-bit hamming code)")
+    ap.add_argument("-j", "--jobs", type=int, default=1, help="Number of worker processes used to correct the dump (0 = one per CPU)")
+    ap.add_argument("-bs", "--block-size", type=intorhex, default=0x20000, help="Erase block size used to split the work between processes")
+    ap.add_argument("-c", "--cache", nargs="?", const="", help="Keep corrected sectors in a sidecar file and reuse them on later runs (default: <in_filename>.ecccache)")
+    ap.add_argument("-S", "--sparse", action="store_true", help="Leave erased (0xff) blocks out of the destination as holes, open it with --sparse in dumpefs")
+    ap.add_argument("-r", "--report", help="Write a per-sector ECC health report (JSON, or CSV when the name ends with .csv)")
 
     args = ap.parse_args()
-    if args.spare_type == "seperate":
-        ap.error("Sorry, but inputing seperate files (data and obb) is not currently supported at this time.")
+    if args.spare_type == "separate" and args.spare_file is None:
+        ap.error("The separate spare type needs the OOB file, pass it with --spare-file")
+
+    if args.block_size <= 0 or args.block_size % 0x200:
+        ap.error("Block size must be a multiple of 512 bytes")
 
-    ecc_spare_type_map = {"riff": SpareType.RIFF, "standard": SpareType.STANDARD, "qcom": SpareType.QCOM_2K}
+    ecc_spare_type_map = {"riff": SpareType.RIFF, "standard": SpareType.STANDARD, "qcom": SpareType.QCOM_2K, "separate": SpareType.SEPARATE}
     ecc_algo_map = {"rs": EccRs, "hamming20": EccHamming20, "hamming20_bitpack": EccHamming20Bitpack if args.width == 8 else EccHamming20Bitpack16}
 
-    nand = ECCFile(args.in_filename, args.spare_offset, ecc_spare_type_map[args.spare_type], args.bbm, args.width, ecc_algo_map[args.ecc_algo])
-    nand_decoded = open(args.out_filename, "wb")
+    if args.cache == "":
+        args.cache = args.in_filename + ".ecccache"
+
+    ecc_args = (args.spare_offset, ecc_spare_type_map[args.spare_type], args.bbm, args.width, ecc_algo_map[args.ecc_algo])
+    nand = ECCFile(args.in_filename, *ecc_args, instrument=args.report is not None, cache=args.cache, spare_file=args.spare_file)
+
+    if args.jobs == 1:
+        nand_decoded = SparseWriter(args.out_filename, args.block_size) if args.sparse else open(args.out_filename, "wb")
+
+        while True:
+            temp = nand.read(0x200)
+            if temp == b"":
+                break
+
+            nand_decoded.write(temp)
+
+        nand_decoded.close()
+        stats = nand.stats
+        saved = nand_decoded.saved if args.sparse else 0
+
+    else:
+        # Each worker decodes whole erase blocks and writes them at their final offset
+        size = nand.size
+        nand.close()
+
+        with open(args.out_filename, "wb") as nand_decoded:
+            nand_decoded.truncate(size)
+
+        ranges = [(s, min(s + args.block_size, size)) for s in range(0, size, args.block_size)]
+        jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+
+        stats = ECCStats(-(-size // 0x200)) if args.report is not None else None
+        holes = []
+
+        with ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=(args.in_filename, ecc_args, args.report is not None, args.cache, args.spare_file)) as pool:
+            for section, section_holes in pool.map(_fix_range, [args.out_filename] * len(ranges), [s for s, _ in ranges], [e for _, e in ranges], [args.sparse] * len(ranges), chunksize=max(1, len(ranges) // (jobs * 8))):
+                if stats is not None:
+                    stats.update(section)
+
+                holes += section_holes
+
+        # Write out whatever the filesystem couldn't keep as a hole
+        fd = os.open(args.out_filename, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+        saved = fill_holes(fd, holes, args.block_size)
+        os.close(fd)
+
+    if args.report is not None:
+        stats.save(args.report, args.block_size // 0x200)
 
-    while True:
-        temp = nand.read(0x200)
-        if temp == b"":
-            break
+        summary = stats.summary()
+        print(f"clean: {summary['clean']}, corrected: {summary['corrected']}, uncorrectable: {summary['uncorrectable']}, erased: {summary['erased']}, cached: {summary['cached']}")
 
-        nand_decoded.write(temp)
+    if args.sparse:
+        print(f"sparse: 0x{saved:x} bytes left as holes")
@@ -1,8 +1,27 @@
 from efs2 import *
+from efs2.partition import Partition
+from efs2.utils import copy_range
+import os
+
+def _split_partition(in_filename: str, out_filename: str, p: Partition, block_size: int, sparse: bool) -> int:
+    with open(in_filename, "rb") as in_file:
+        length = p.length
+
+        if p.name in ["EFS2", "EFS2APPS"] and length == -1:
+            in_file.seek(p.start)
+            length = compute_efs2_size(in_file)
+
+        out_file = SparseWriter(out_filename, block_size) if sparse else open(out_filename, "wb")
+
+        try:
+            return copy_range(in_file, out_file, p.start, length)
+
+        finally:
+            out_file.close()
 
 if __name__ == "__main__":
     import argparse
-    import os
+    from concurrent.futures import ThreadPoolExecutor
 
     def intorhex(d):
         try:
@@ -14,41 +33,23 @@ if __name__ == "__main__":
     ap = argparse.ArgumentParser("QC dump fixer")
     ap.add_argument("in_filename", help="Source file")
     ap.add_argument("out_folder", help="Destination folder")
-    ap.add_argument("block_size", type=intorhex, help="Block size (0x4000 for 512 bytes, 0x20000 for 2k bytes)")
+    ap.add_argument("block_size", nargs="?", type=intorhex, help="Block size (0x4000 for 512 bytes, 0x20000 for 2k bytes, default: inferred from the partition table)")
+    ap.add_argument("-j", "--jobs", type=int, default=4, help="Number of partitions written at the same time")
+    ap.add_argument("-S", "--sparse", action="store_true", help="Leave erased (0xff) blocks out of the partitions as holes, open them with --sparse in dumpefs")
 
     args = ap.parse_args()
-    partTable = None
-
-    in_file = open(args.in_filename, "rb")
     os.makedirs(args.out_folder, exist_ok=True)
 
-    while True:
-        a = in_file.read(args.block_size)
+    try:
+        partTable = find_partition_table(args.in_filename, args.block_size)
 
-        try:
-            if a[0x200:0x208] == b"\xAA\x73\xEE\x55\xDB\xBD\x5E\xE3":
-                partTable = PartitionTable(a[0x200:], args.block_size)
-                break
-
-            elif a[0x800:0x808] == b"\xAA\x73\xEE\x55\xDB\xBD\x5E\xE3":
-                partTable = PartitionTable(a[0x800:], args.block_size)
-                break
-
-            elif a[0x1000:0x1008] == b"\xAA\x73\xEE\x55\xDB\xBD\x5E\xE3":
-                partTable = PartitionTable(a[0x1000:], args.block_size)
-                break
-
-        except Exception:
-            pass
-
-    for p in partTable.partitions:
-        in_file.seek(p.start)
-        
-        if p.name in ["EFS2", "EFS2APPS"] and p.length == -1:
-            data = in_file.read()
-            data = data[:compute_efs2_size(data)]
-            
-        else:
-            data = in_file.read(p.length if p.length >= 0 else None)
-        
-        open(os.path.join(args.out_folder, f"{p.name}.bin"), "wb").write(data)
\ No newline at end of file
+    except Exception as e:
+        ap.error(e)
+
+    print(f"Partition table at 0x{partTable.offset:x}, block size 0x{partTable.block_size:x}")
+
+    with ThreadPoolExecutor(max(1, args.jobs)) as pool:
+        futures = [(p, pool.submit(_split_partition, args.in_filename, os.path.join(args.out_folder, f"{p.name}.bin"), p, partTable.block_size, args.sparse)) for p in partTable.partitions]
+
+        for p, future in futures:
+            print(f"{p.name}: 0x{future.result():x} bytes")